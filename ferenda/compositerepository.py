@@ -4,14 +4,87 @@ from __future__ import (absolute_import, division,
 from builtins import *
 
 import os
+import sys
 import time
+import errno
 import logging
 from collections import defaultdict, OrderedDict
+try:
+    from collections.abc import Mapping
+except ImportError:  # py2
+    from collections import Mapping
+try:
+    from os import scandir
+except ImportError:  # py2, py3 < 3.5
+    from scandir import scandir
 
 from ferenda import DocumentRepository, DocumentStore
 from ferenda import util, errors
 from ferenda.decorators import updateentry
 
+_MISSING = object()
+
+# custom loglevel used for subrepos, see CompositeRepository.get_instance
+INFOEX = logging.INFO + 1
+logging.addLevelName(INFOEX, "INFOEX")
+
+def _outfile_is_newer(infile, outfile):
+    # Same semantics as util.outfile_is_newer([infile], outfile), but
+    # with a single stat call per file instead of exists + stat.
+    try:
+        outfile_mtime = os.stat(outfile).st_mtime
+    except OSError:
+        return False
+    try:
+        return os.stat(infile).st_mtime <= outfile_mtime
+    except OSError:
+        return True
+
+def _link(src, dst):
+    # Same result as util.link_or_copy, but optimistically tries to
+    # create the symlink directly, and only deals with a missing
+    # directory or an existing dst if that fails, instead of always
+    # doing ensure_dir + lexists + unlink first. An existing dst is
+    # replaced atomically through a temporary link.
+    if sys.platform == 'win32':
+        return util.link_or_copy(src, dst)
+    relsrc = os.path.relpath(src, os.path.dirname(dst))
+    try:
+        os.symlink(relsrc, dst)
+    except OSError as e:
+        if e.errno == errno.EEXIST:
+            tmp = dst + ".lnktmp"
+            if os.path.lexists(tmp):
+                os.unlink(tmp)
+            os.symlink(relsrc, tmp)
+            os.rename(tmp, dst)
+        elif e.errno == errno.ENOENT:
+            util.ensure_dir(dst)
+            os.symlink(relsrc, dst)
+        else:
+            raise
+
+class SubrepoInstances(Mapping):
+    """Ordered, read-only mapping from each subrepo class of a
+    CompositeRepository to an instance of that class. Instances are
+    created (through :meth:`CompositeRepository.get_instance`) the
+    first time they are accessed."""
+
+    def __init__(self, repo):
+        self.repo = repo
+
+    def __getitem__(self, instanceclass):
+        if instanceclass not in self.repo.subrepos:
+            raise KeyError(instanceclass)
+        return self.repo.get_instance(instanceclass)
+
+    def __iter__(self):
+        return iter(self.repo.subrepos)
+
+    def __len__(self):
+        return len(self.repo.subrepos)
+
+
 class CompositeStore(DocumentStore):
     """Custom store for CompositeRepository objects."""
 
@@ -25,6 +98,9 @@ class CompositeStore(DocumentStore):
             docrepo_instances = OrderedDict()
         self.docrepo_instances = docrepo_instances
         self.basefiles = defaultdict(set)
+        self._basefile_classes = None
+        self._removal_stores = None
+        self._pathcache = {}
 
     def list_basefiles_for(self, action, basedir=None, force=True):
         if not basedir:
@@ -35,23 +111,100 @@ class CompositeStore(DocumentStore):
         # of download (see lagen.nu.myndfskr), we only need to query
         # subrepos prior to the parse step
         if action in ("parse"): 
+            # this loop may run for every basefile in every subrepo,
+            # so bound methods are looked up once per subrepo and
+            # set.add + len is used instead of a separate membership
+            # test
             documents = set()
+            documents_add = documents.add
             for cls, inst in self.docrepo_instances.items():
+                cls_add = self.basefiles[cls].add
                 for basefile in inst.store.list_basefiles_for(action, force=force):
-                    self.basefiles[cls].add(basefile)
-                    if basefile not in documents:
-                        documents.add(basefile)
+                    cls_add(basefile)
+                    seen = len(documents)
+                    documents_add(basefile)
+                    if len(documents) != seen:
                         yield basefile
+            self._build_basefile_index()
         else:
             for basefile in super(CompositeStore,
                                   self).list_basefiles_for(action, basedir, force):
                 yield basefile
 
+    def _build_basefile_index(self):
+        index = {}
+        for cls, basefiles in self.basefiles.items():
+            for basefile in basefiles:
+                index.setdefault(basefile, []).append(cls)
+        self._basefile_classes = dict((k, tuple(v)) for k, v in index.items())
+
+    def classes_for(self, basefile):
+        """Returns a tuple of the subrepo classes that are known to
+        have *basefile* (i.e. reported it in
+        :meth:`list_basefiles_for`)."""
+        # The index is built after a complete discovery pass. Fall
+        # back to probing the per-class sets for basefiles that
+        # weren't seen then (or if no such pass has been made).
+        if self._basefile_classes is not None:
+            classes = self._basefile_classes.get(basefile)
+            if classes is not None:
+                return classes
+        return tuple(cls for cls, basefiles in self.basefiles.items()
+                     if basefile in basefiles)
+
+    # The parsed, distilled and documententry paths of the current
+    # version of a basefile are pure functions of the basefile (and
+    # storage policy), and are requested several times per basefile
+    # during parse. Memoize them in a bounded dict. Methods that check
+    # for existing files (downloaded_path, intermediate_path) are not
+    # memoized.
+    pathcache_size = 4096
+
+    def _cached_path(self, meth, basefile):
+        key = (meth.__name__, basefile, self.storage_policy)
+        path = self._pathcache.get(key)
+        if path is None:
+            if len(self._pathcache) >= self.pathcache_size:
+                self._pathcache.clear()
+            path = self._pathcache[key] = meth(basefile)
+        return path
+
+    def parsed_path(self, basefile, version=None, attachment=None):
+        if version or attachment:
+            return super(CompositeStore, self).parsed_path(basefile, version, attachment)
+        return self._cached_path(super(CompositeStore, self).parsed_path, basefile)
+
+    def distilled_path(self, basefile, version=None):
+        if version:
+            return super(CompositeStore, self).distilled_path(basefile, version)
+        return self._cached_path(super(CompositeStore, self).distilled_path, basefile)
+
+    def documententry_path(self, basefile, version=None):
+        if version:
+            return super(CompositeStore, self).documententry_path(basefile, version)
+        return self._cached_path(super(CompositeStore, self).documententry_path, basefile)
+
+    def _unique_stores(self):
+        # Several subrepos may share a data directory (eg. through
+        # symlinks). Stores of the same class, with the same storage
+        # policy and the same real datadir calculate the same paths,
+        # so only one of them needs to remove anything.
+        if self._removal_stores is None:
+            stores = OrderedDict()
+            for inst in self.docrepo_instances.values():
+                key = (os.path.realpath(inst.store.datadir),
+                       inst.store.storage_policy,
+                       inst.store.__class__)
+                stores.setdefault(key, inst.store)
+            self._removal_stores = tuple(stores.values())
+        return self._removal_stores
+
     def remove(self, basefile):
         removed = 0
-        for cls, inst in self.docrepo_instances.items():
-            removed += inst.store.remove(basefile)
+        for store in self._unique_stores():
+            removed += store.remove(basefile)
         removed += super(CompositeStore, self).remove(basefile)
+        self._pathcache.clear()
         return removed
 
 class CompositeRepository(DocumentRepository):
@@ -73,31 +226,41 @@ class CompositeRepository(DocumentRepository):
 
     supress_subrepo_logging = True
 
+    def get_subrepo_config(self, instanceclass):
+        """Returns the config object that should be used for a new
+        instance of *instanceclass*. The result is cached per
+        instanceclass, since probing a LayeredConfig object for
+        subsections is comparatively expensive."""
+        if instanceclass in self._subrepo_configs:
+            return self._subrepo_configs[instanceclass]
+        if hasattr(self, '_config'):
+            config = self.config
+        else:
+            # if we don't have a config object yet, the created
+            # instance is just temporary -- don't save it
+            return None
+
+        # slightly magical: If our config object has a subsection
+        # that matches the instanceclass alias, use that
+        # subsection. Same if our config object's parent has a
+        # subsection that matches the instanceclass alias.
+        subconfig = getattr(config, instanceclass.alias, _MISSING)
+        if subconfig is _MISSING:
+            subconfig = getattr(config._parent, instanceclass.alias, _MISSING)
+        if subconfig is not _MISSING:
+            config = subconfig
+        self._subrepo_configs[instanceclass] = config
+        return config
+
     def get_instance(self, instanceclass):
         if instanceclass not in self._instances:
-            if hasattr(self, '_config'):
-                config = self.config
-            else:
-                # if we don't have a config object yet, the created
-                # instance is just temporary -- don't save it
-                config = None
-
             # FIXME: this instance will be using a default
             # ResourceLoader, eg if a subrepo is at foo/bar.py, only
             # foo/bar/res will we in that resourceloaders path. This
             # causes problems, primarily if our CompositeRepository is
             # subclassed to somewhere else, eg subclass/bar.py -- we
             # might want to use resources at subclass/res instead.
-
-            # slightly magical: If our config object has a subsection
-            # that matches the instanceclass alias, use that
-            # subsection. Same if our config object's parent has a
-            # subsection that matches the instanceclass alias.
-            if hasattr(config, instanceclass.alias):
-                config = getattr(config, instanceclass.alias)
-            elif  hasattr(config._parent, instanceclass.alias):
-                config = getattr(config._parent, instanceclass.alias)
-
+            config = self.get_subrepo_config(instanceclass)
             inst = instanceclass(config)
             if hasattr(self, '_config') and self.supress_subrepo_logging:
                 # if the composite object has loglevel INFO, make the
@@ -117,42 +280,70 @@ class CompositeRepository(DocumentRepository):
                 # downloaded and so can't provide a INFO logging of
                 # it). We try to work around this in the download
                 # method.
-                if (self.log.getEffectiveLevel() == logging.INFO and
-                    inst.log.getEffectiveLevel() == logging.INFO and
-                    not isinstance(inst, CompositeRepository)):
-                    customlevel = inst.log.getEffectiveLevel() + 1
-                    logging.addLevelName(customlevel, "INFOEX")
-                    inst.log.setLevel(customlevel)
+                if (not isinstance(inst, CompositeRepository) and
+                    self.log.getEffectiveLevel() == logging.INFO and
+                    inst.log.getEffectiveLevel() == logging.INFO):
+                    inst.log.setLevel(INFOEX)
+            # qualified_class_name() is used in error reporting for
+            # every failed parse, so compute it once
+            inst._qcn = inst.qualified_class_name()
             self._instances[instanceclass] = inst
         return self._instances[instanceclass]
 
+    def iter_instances(self):
+        """Yields an instance of each subrepo, in order. Instances are
+        created as needed, so a caller that stops iterating early
+        never pays for creating the remaining ones."""
+        if self._ordered_instances is None:
+            for c in self.subrepos:
+                yield self.get_instance(c)
+            # every subrepo has now been instantiated, so later
+            # iterations can skip the get_instance lookups
+            self._ordered_instances = tuple(self._instances[c] for c in self.subrepos)
+        else:
+            for inst in self._ordered_instances:
+                yield inst
+
     def __init__(self, config=None, **kwargs):
         self._instances = OrderedDict()
+        self._ordered_instances = None
+        self._subrepo_configs = {}
         # after this, self.config WILL be set (regardless of whether a
         # config object was provided or not
         super(CompositeRepository, self).__init__(config, **kwargs)
 
-        newsubrepos = []
-        for c in self.subrepos:  # populate self._instances
-            if self.extrabases:
-                bases = [x for x in self.extrabases if x not in c.__bases__]
-                bases.append(c)
-                c = type(c.__name__, tuple(bases), dict(c.__dict__))
-                newsubrepos.append(c)
-            if self.loadpath:
+        # NB: subrepo instances are not created here, but on first
+        # use through get_instance
+        if self.extrabases:
+            self.subrepos = self.composed_subrepos()
+        if self.loadpath:
+            for c in self.subrepos:
                 c.loadpath = self.loadpath
-            self.get_instance(c)
-        if newsubrepos:
-            self.subrepos = newsubrepos
         cls = self.documentstore_class
 
         self.store = cls(self.config.datadir + os.sep + self.alias,
                          storage_policy=self.storage_policy,
-                         docrepo_instances=self._instances)
+                         docrepo_instances=SubrepoInstances(self))
         if self.downloaded_suffix != ".html" and self.store.downloaded_suffixes == [".html"]:
             self.store.downloaded_suffixes = [self.downloaded_suffix]
 
 
+    @classmethod
+    def composed_subrepos(cls):
+        """Returns the subrepo classes with :py:data:`extrabases` mixed
+        in. The classes are created once per CompositeRepository
+        subclass and then shared by all its instances."""
+        # check cls.__dict__, not cls, so that subclasses (that might
+        # have other subrepos or extrabases) get their own classes
+        if '_composed_subrepos' not in cls.__dict__:
+            composed = []
+            for c in cls.subrepos:
+                bases = [x for x in cls.extrabases if x not in c.__bases__]
+                bases.append(c)
+                composed.append(type(c.__name__, tuple(bases), dict(c.__dict__)))
+            cls._composed_subrepos = tuple(composed)
+        return cls._composed_subrepos
+
     @classmethod
     def get_default_options(cls):
         # 1. Get options from superclass (NB: according to MRO...)
@@ -164,6 +355,8 @@ class CompositeRepository(DocumentRepository):
                     opts[k] = v
         # 3. add the extra 'failfast' option
         opts['failfast'] = False
+        # 4. and the option to run all subrepo downloads concurrently
+        opts['concurrent_subrepo_download'] = False
         return opts
 
     # FIXME: we have no real need for this property getter override
@@ -180,38 +373,60 @@ class CompositeRepository(DocumentRepository):
         # no attribute 'config'), so we just copy the entire method
         # super(CompositeRepository, self).config = config
         self._config = config
+        self._subrepo_configs = {}
+        datadir = config.datadir + os.sep + self.alias
+        oldstore = getattr(self, 'store', None)
+        if (oldstore is not None and oldstore.datadir == datadir and
+                oldstore.storage_policy == self.storage_policy):
+            # keep the existing store, including the basefiles found
+            # by any previous list_basefiles_for("parse") call
+            return
         self.store = self.documentstore_class(
-            config.datadir + os.sep + self.alias,
+            datadir,
             storage_policy=self.storage_policy,
-            docrepo_instances=self._instances)
+            docrepo_instances=SubrepoInstances(self))
 
     def download(self, basefile=None):
-        for c in self.subrepos:
-            inst = self.get_instance(c)
-            # make sure that our store has access to our now
-            # initialized subrepo objects
-            if c not in self.store.docrepo_instances:
-                self.store.docrepo_instances[c] = inst
-            try:
-                # temporarily re-set the logging level so that the
-                # subrepos INFO messages get reported (see note in
-                # get_instance).
-                loglevel_workaround = False
-                if (self.log.getEffectiveLevel() == logging.INFO and
-                    inst.log.getEffectiveLevel() == logging.INFO + 1):
-                    loglevel_workaround = True
-                    inst.log.setLevel(self.log.getEffectiveLevel())
-                ret = inst.download(basefile)
-                if loglevel_workaround:
-                    inst.log.setLevel(self.log.getEffectiveLevel() + 1)
-            except Exception as e:  # be resilient
-                loc = util.location_exception(e)
-                self.log.error("download for %s failed: %s (%s)" % (c.alias, e, loc))
-                ret = False
+        # the loglevel might be changed after we're created, but
+        # won't change during a download
+        log_is_info = self.log.getEffectiveLevel() == logging.INFO
+        if basefile is None and self.config.concurrent_subrepo_download:
+            # subrepos normally download from different sites, so
+            # there's no reason to wait for one before starting the
+            # next. Instances are created here, in the calling thread.
+            from concurrent.futures import ThreadPoolExecutor
+            instances = list(self.iter_instances())
+            if not instances:
+                return
+            with ThreadPoolExecutor(max_workers=len(instances)) as executor:
+                list(executor.map(lambda inst: self._download_subrepo(inst, None, log_is_info),
+                                  instances))
+            return
+        for inst in self.iter_instances():
+            ret = self._download_subrepo(inst, basefile, log_is_info)
             if basefile and ret:
                 # we got the doc we want, we're done!
                 return
 
+    def _download_subrepo(self, inst, basefile, log_is_info):
+        try:
+            # temporarily re-set the logging level so that the
+            # subrepos INFO messages get reported (see note in
+            # get_instance).
+            loglevel_workaround = False
+            if (log_is_info and
+                inst.log.getEffectiveLevel() == INFOEX):
+                loglevel_workaround = True
+                inst.log.setLevel(logging.INFO)
+            ret = inst.download(basefile)
+            if loglevel_workaround:
+                inst.log.setLevel(INFOEX)
+        except Exception as e:  # be resilient
+            loc = util.location_exception(e)
+            self.log.error("download for %s failed: %s (%s)" % (inst.alias, e, loc))
+            ret = False
+        return ret
+
     # NOTE: this impl should NOT use the @managedparsing decorator --
     # but it can use @updateentry to catch warnings and errors thrown
     # by a subrepo
@@ -226,11 +441,9 @@ class CompositeRepository(DocumentRepository):
         # performance
         force = (self.config.force is True or
                  self.config.parseforce is True)
-        if not force:
-            for c in self.subrepos:
-                inst = self.get_instance(c)
-                needed = inst.store.needed(basefile, "parse")
-                if not needed and os.path.exists(self.store.parsed_path(basefile)):
+        if not force and os.path.exists(self.store.parsed_path(basefile)):
+            for inst in self.iter_instances():
+                if not inst.store.needed(basefile, "parse"):
                     self.log.debug("%s: Skipped" % basefile)
                     return True  # signals everything OK
 
@@ -246,10 +459,11 @@ class CompositeRepository(DocumentRepository):
                 if self.config.failfast:
                     raise
                 else:
-                    self.log.debug("%s: parse with %s failed: %s" %
-                                   (basefile,
-                                    inst.qualified_class_name(),
-                                    str(e)))
+                    if self.log.isEnabledFor(logging.DEBUG):
+                        self.log.debug("%s: parse with %s failed: %s",
+                                       basefile,
+                                       getattr(inst, "_qcn", None) or inst.qualified_class_name(),
+                                       e)
                     ret = False
             if ret:
                 break
@@ -264,8 +478,12 @@ class CompositeRepository(DocumentRepository):
                 basefile = ret
                 # Also, touch the old parsed path so we don't
                 # regenerate.
-                with self.store.open_parsed(oldbasefile, "w"):
-                    pass
+                oldparsed = self.store.parsed_path(oldbasefile)
+                try:
+                    os.utime(oldparsed, None)
+                except OSError:
+                    util.ensure_dir(oldparsed)
+                    open(oldparsed, "wb").close()
                 
 
             self.copy_parsed(basefile, inst)
@@ -275,15 +493,17 @@ class CompositeRepository(DocumentRepository):
 
             if basefile != oldbasefile:
                 msg = "%s: In subrepo %s basefile turned out to really be %s" % (
-                    oldbasefile, inst.qualified_class_name(), basefile)
+                    oldbasefile,
+                    getattr(inst, "_qcn", None) or inst.qualified_class_name(),
+                    basefile)
                 raise errors.DocumentRenamedError(True, msg, oldbasefile, basefile)
             return ret
         else:
             # subrepos should only contain those repos that actually
             # had a chance of parsing (basefile in
             # self.store.basefiles[c])
-            subrepos_lbl = ", ".join([self.get_instance(x).qualified_class_name()
-                                      for x in self.subrepos if basefile in self.store.basefiles[x]])
+            subrepos_lbl = ", ".join([self.get_instance(x)._qcn
+                                      for x in self.store.classes_for(basefile)])
             if subrepos_lbl:
                 raise errors.ParseError(
                     "No instance of %s was able to parse %s" %
@@ -295,43 +515,75 @@ class CompositeRepository(DocumentRepository):
                 
 
     def get_preferred_instances(self, basefile):
-        for c in self.subrepos:
-            inst = self.get_instance(c)
-            if (basefile in self.store.basefiles[c] or
-                os.path.exists(inst.store.downloaded_path(basefile))):
-                yield(inst)
+        # only stat the downloaded file if the discovery step in
+        # list_basefiles_for didn't already tell us that the subrepo
+        # has this basefile
+        known = self.store.classes_for(basefile)
+        exists = os.path.exists
+        for inst in self.iter_instances():
+            if inst.__class__ in known:
+                yield inst
+            elif exists(inst.store.downloaded_path(basefile)):
+                yield inst
 
     def copy_parsed(self, basefile, instance):
+        src_distilled = instance.store.distilled_path(basefile)
+        dst_distilled = self.store.distilled_path(basefile)
+        src_parsed = instance.store.parsed_path(basefile)
+        dst_parsed = self.store.parsed_path(basefile)
+
         # If the distilled and parsed links are recent, assume that
         # all external resources are OK as well
-        
-        if (not self.config.force and 
-            util.outfile_is_newer([instance.store.distilled_path(basefile)],
-                                  self.store.distilled_path(basefile)) and
-            util.outfile_is_newer([instance.store.parsed_path(basefile)],
-                                  self.store.parsed_path(basefile))):
+        if (not self.config.force and
+            _outfile_is_newer(src_distilled, dst_distilled) and
+            _outfile_is_newer(src_parsed, dst_parsed)):
             self.log.debug("%s: Attachments are (likely) up-to-date" % basefile)
             return
 
-        util.link_or_copy(instance.store.documententry_path(basefile),
-                          self.store.documententry_path(basefile))
-
-        util.link_or_copy(instance.store.distilled_path(basefile),
-                          self.store.distilled_path(basefile))
-
-        util.link_or_copy(instance.store.parsed_path(basefile),
-                          self.store.parsed_path(basefile))
+        _link(instance.store.documententry_path(basefile),
+              self.store.documententry_path(basefile))
+        _link(src_distilled, dst_distilled)
+        _link(src_parsed, dst_parsed)
 
         cnt = 0
         if instance.store.storage_policy == "dir":
-            for attachment in instance.store.list_attachments(basefile, "parsed"):
-                cnt += 1
-                src = instance.store.parsed_path(basefile, attachment=attachment)
-                target = self.store.parsed_path(basefile, attachment=attachment)
-                util.link_or_copy(src, target)
+            # Enumerate the subrepo's parsed directory once, rather
+            # than going through list_attachments and building two
+            # full paths per attachment.
+            src_dir = os.path.dirname(src_parsed)
+            dst_dir = os.path.dirname(dst_parsed)
+            mainfile = os.path.basename(src_parsed)
+            invalid_suffixes = tuple(instance.store.invalid_suffixes)
+            # loop invariants, bound to locals since this loop runs
+            # once per attachment
+            link = _link
+            dst_prefix = dst_dir + os.sep
+            dst_is_dir = self.store.storage_policy == "dir"
+            # attachments may be in subdirectories (eg
+            # "images/x.png"), so walk the whole tree like
+            # list_attachments does. _link creates any missing target
+            # directories.
+            dirs = [("", src_dir)]
+            while dirs:
+                prefix, directory = dirs.pop()
+                for entry in scandir(directory):
+                    name = prefix + entry.name
+                    if entry.is_dir():
+                        # like os.walk, don't follow directory symlinks
+                        if not entry.is_symlink():
+                            dirs.append((name + os.sep, entry.path))
+                        continue
+                    if name == mainfile or name.endswith(invalid_suffixes):
+                        continue
+                    if not dst_is_dir:
+                        raise errors.AttachmentPolicyError(
+                            "Can't add attachments (name %s) if "
+                            "storage_policy != 'dir'" % name)
+                    cnt += 1
+                    link(entry.path, dst_prefix + name)
             if cnt:
                 self.log.debug("%s: Linked %s attachments from %s to %s" %
                                (basefile,
                                 cnt,
-                                os.path.dirname(instance.store.parsed_path(basefile)),
-                                os.path.dirname(self.store.parsed_path(basefile))))
+                                os.path.dirname(src_parsed),
+                                os.path.dirname(dst_parsed)))
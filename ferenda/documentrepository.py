@@ -528,21 +528,26 @@ class DocumentRepository(object):
         :rtype: rdflib.term.URIRef
 
         """
-
+        resource, match = self._lookup_resource(label, predicate, cutoff)
+        # even if we want warnings, we don't want warnings for case changes
+        if warn and label.lower() != match.lower():
+            self.log.warning("Assuming that '%s' should be '%s'?" %
+                             (label, match))
+        return resource
+
+    def _lookup_resource(self, label, predicate, cutoff):
+        # does the actual matching for lookup_resource. Returns the
+        # resource and the label that matched, or raises KeyError.
         resources = {}
         for (resource, candidate_label) in self.commondata.subject_objects(predicate):
             if label == str(candidate_label):
-                return resource
+                return resource, label
             else:
                 resources[str(candidate_label)] = resource
 
         fuzz = difflib.get_close_matches(label, resources.keys(), 1, cutoff)
         if fuzz:
-            # even if we want warnings, we don't want warnings for case changes
-            if warn and label.lower() != fuzz[0].lower():
-                self.log.warning("Assuming that '%s' should be '%s'?" %
-                                 (label, fuzz[0]))
-            return URIRef(resources[fuzz[0]])
+            return URIRef(resources[fuzz[0]]), fuzz[0]
         else:
             raise KeyError("No good match for '%s'" % label)
 
@@ -32,6 +32,7 @@ class FSMParser():
         self.initial_constructor = None
         # pseudo-internal
         self._state_stack = []
+        self._applicable = {}  # state -> recognizers to try, in order
         self.log = logging.getLogger(__name__)
 
     def _debug(self, msg):
@@ -49,9 +50,11 @@ class FSMParser():
         order to recognize symbols from the stream of text
         chunks. Recognizers are tried in the order specified here."""
         self.recognizers = args
+        self._applicable = {}
 
     def remove_recognizer(self, recognizer):
         self.recognizers = tuple(x for x in self.recognizers if x != recognizer)
+        self._applicable = {}
 
     def set_transitions(self, transitions):
         """Set the transition table for the state matchine.
@@ -60,6 +63,7 @@ class FSMParser():
 
         """
         self.transitions = {}
+        self._applicable = {}
         for (before, after) in transitions.items():
             (before_states, recognizer) = before
             if not callable(after):
@@ -114,42 +118,54 @@ class FSMParser():
     def analyze_symbol(self):
         """Internal function used by make_children()"""
         try:
-            rawchunk = self.reader.peek()
-            chunk = str(rawchunk)
-            # chunk = repr(rawchunk)
-            if len(chunk) > 90:
-                # chunk = chunk[:25] + "[...]" + chunk[-10:]
-                seg = (chunk[:25], chunk[-10:])
-                try:
-                    chunk = "%s [...] %s" % seg
-                except UnicodeDecodeError:
-                    chunk = "%r [...] %r" % seg
-            else:
-                chunk = chunk
-
+            # peekstr() shares the conversion with any recognizers
+            # that use it. The shortened version for messages is only
+            # made when needed (see _display_chunk)
+            chunk = self.reader.peekstr()
         except StopIteration:
             self._debug("We're done!")
             return None
 
-        applicable_tmp = [x[1]
-                          for x in self.transitions.keys() if x[0] == self._state_stack[-1]]
-        # Create correct sorting of applicable_recognizers
-        applicable_recognizers = []
-        for recognizer in self.recognizers:
-            if recognizer in applicable_tmp:
-                applicable_recognizers.append(recognizer)
+        state = self._state_stack[-1]
+        applicable_recognizers = self._applicable.get(state)
+        if applicable_recognizers is None:
+            # the transition table doesn't change during parsing, so
+            # only find out which recognizers apply once per state
+            applicable_tmp = [x[1]
+                              for x in self.transitions.keys() if x[0] == state]
+            # Create correct sorting of applicable_recognizers
+            applicable_recognizers = []
+            for recognizer in self.recognizers:
+                if recognizer in applicable_tmp:
+                    applicable_recognizers.append(recognizer)
+            self._applicable[state] = applicable_recognizers
 
-        applicable_display = ", ".join([x.__name__ for x in applicable_recognizers])
         for recognizer in applicable_recognizers:
             if recognizer(self):
-                self._debug("Tested '%s' against %s -> %s " %
-                            (chunk, applicable_display,
-                             recognizer.__name__))
+                if self.debug:
+                    self._debug("Tested '%s' against %s -> %s " %
+                                (self._display_chunk(chunk),
+                                 self._display_recognizers(applicable_recognizers),
+                                 recognizer.__name__))
                 # self._debug("%r -> %s" % (chunk, recognizer.__name__))
                 return recognizer
         raise FSMStateError(
             "No recognizer match for %s (tried %s)" %
-            (chunk, applicable_display))
+            (self._display_chunk(chunk),
+             self._display_recognizers(applicable_recognizers)))
+
+    def _display_chunk(self, chunk):
+        if len(chunk) > 90:
+            # chunk = chunk[:25] + "[...]" + chunk[-10:]
+            seg = (chunk[:25], chunk[-10:])
+            try:
+                chunk = "%s [...] %s" % seg
+            except UnicodeDecodeError:
+                chunk = "%r [...] %r" % seg
+        return chunk
+
+    def _display_recognizers(self, recognizers):
+        return ", ".join([x.__name__ for x in recognizers])
 
     def transition(self, currentstate, symbol):
         """Internal function used by make_children()"""
@@ -198,13 +214,14 @@ class FSMParser():
             (constructor, newstate) = self.transition(self._state_stack[-1],
                                                       symbol)
 
-            if constructor is False:
-                self._debug("transition(%r,%s()) -> (False,%r)" %
-                            (self._state_stack[-1], symbol.__name__, newstate))
-            else:
-                self._debug("transition(%r,%s()) -> (%s(),%r)" %
-                            (self._state_stack[-1], symbol.__name__,
-                             constructor.__name__, newstate))
+            if self.debug:
+                if constructor is False:
+                    self._debug("transition(%r,%s()) -> (False,%r)" %
+                                (self._state_stack[-1], symbol.__name__, newstate))
+                else:
+                    self._debug("transition(%r,%s()) -> (%s(),%r)" %
+                                (self._state_stack[-1], symbol.__name__,
+                                 constructor.__name__, newstate))
 
             # if transition() indicated that we should change state,
             # first find out whether the constructor will call
@@ -246,6 +263,7 @@ class Peekable(object):
     def __init__(self, iterable):
         self._iterable = iter(iterable)
         self._cache = deque()
+        self._peekstr = None
 
     def __iter__(self):
         return self
@@ -257,6 +275,7 @@ class Peekable(object):
     def __next__(self):
         self._fillcache()
         result = self._cache.popleft()
+        self._peekstr = None
         return result
 
     # useful alias
@@ -266,3 +285,12 @@ class Peekable(object):
         self._fillcache(chunkno)
         result = self._cache[chunkno-1]
         return result
+
+    def peekstr(self):
+        """Returns the next chunk as a string, like ``str(peek())``,
+        but only converts it once no matter how many recognizers look
+        at it."""
+        chunk = self.peek()
+        if self._peekstr is None or self._peekstr[0] is not chunk:
+            self._peekstr = (chunk, str(chunk))
+        return self._peekstr[1]
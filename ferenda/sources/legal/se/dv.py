@@ -7,29 +7,43 @@ hämtas fran DV:s (ickepublika) FTP-server, eller fran lagen.nu."""
 
 # system libraries (incl six-based renames)
 from bz2 import BZ2File
-from collections import defaultdict
+from collections import defaultdict, deque, OrderedDict
+from contextlib import closing
 from datetime import datetime, timedelta, date
-from ftplib import FTP
+from ftplib import FTP, error_perm
 from io import BytesIO
 from time import mktime
 from urllib.parse import urljoin, urlparse
+import atexit
 import codecs
 import itertools
 import logging
 import os
 import re
+import shutil
 import tempfile
 import zipfile
+try:
+    from functools import lru_cache
+except ImportError:
+    from backports.functools_lru_cache import lru_cache
+try:
+    from os import scandir
+except ImportError:  # py2
+    from scandir import scandir
+try:  # optional module, see DV.re_notis_malnr
+    import re2
+except ImportError:
+    re2 = None
 
 # 3rdparty libs
 from ferenda.requesthandler import UnderscoreConverter
 from cached_property import cached_property
-from rdflib import Namespace, URIRef, Graph, RDF, RDFS, BNode
+from rdflib import Namespace, URIRef, Graph, RDF, RDFS, BNode, Literal
 from rdflib.namespace import DCTERMS, SKOS, FOAF
 import requests
-import lxml.html
 from lxml import etree
-from bs4 import BeautifulSoup, NavigableString
+from bs4 import BeautifulSoup, NavigableString, SoupStrainer
 
 
 # my libs
@@ -48,6 +62,24 @@ from .swedishlegalsource import SwedishLegalHandler
 
 PROV = Namespace(util.ns['prov'])
 
+
+def _iter_xhtml(root):
+    """Recursively yield a :py:class:`os.DirEntry` for each .xhtml file
+    below *root*, in the same order as :py:func:`ferenda.util.list_dirs`."""
+    try:
+        children = sorted(scandir(root), key=lambda e: util.split_numalpha(e.name))
+    except OSError:  # root doesn't exist (yet)
+        return
+    dirs = []
+    for entry in children:
+        if entry.is_dir(follow_symlinks=False):
+            dirs.append(entry)
+        elif entry.name.endswith(".xhtml"):
+            yield entry
+    for entry in dirs:
+        for subentry in _iter_xhtml(entry.path):
+            yield subentry
+
 class DVConverterBase(UnderscoreConverter):
     regex = "[^/].*?"
     repo = None  # we create a subclass of this at runtime, when we have access to the repo object
@@ -128,6 +160,20 @@ class DV(SwedishLegalSource):
     sparql_expect_results = False
     xslt_template = "xsl/dv.xsl"
 
+    re_xmlbase = re.compile(b'<head about="([^"]+)"')
+
+    # patterns used by extract_notis to find the start of each notis
+    # (and, for HDO, the start of each month section)
+    re_notisstart_hdo = re.compile(
+        r"(?P<day>Den\s+\d+\s*:[ae].\s+|)(?P<ordinal>\d+)\s*\.\s*\((?P<malnr>\w\s\d+-\d+)\)",
+        flags=re.UNICODE)
+    re_avdstart_hdo = re.compile(
+        "(Januari|Februari|Mars|April|Maj|Juni|Juli|Augusti|September|Oktober|November|December)$")
+    re_notisstart_hfd = re.compile(
+        r"[\w\: ]*Lnr:(?P<court>\w+) ?(?P<year>\d+) ?not ?(?P<ordinal>\d+)",
+        flags=re.UNICODE)
+    re_notisstart_hfd_2016 = re.compile(r"Not (?P<ordinal>\d+)$")
+
     @classmethod
     def relate_all_setup(cls, config, *args, **kwargs):
         # FIXME: If this was an instancemethod, we could use
@@ -136,10 +182,17 @@ class DV(SwedishLegalSource):
         mapfile = os.path.sep.join(
             [config.datadir, 'dv', 'generated', 'uri.map'])
         log = logging.getLogger(cls.alias)
-        if (not util.outfile_is_newer(util.list_dirs(parsed_dir, ".xhtml"), mapfile)) or config.force:
-            re_xmlbase = re.compile('<head about="([^"]+)"')
+        # walk the parsed tree once, and use the stat results cached
+        # by each DirEntry both for the freshness check and for
+        # skipping empty files below.
+        entries = list(_iter_xhtml(parsed_dir))
+        if os.path.exists(mapfile):
+            mapfile_mtime = os.stat(mapfile).st_mtime
+            stale = any(e.stat().st_mtime > mapfile_mtime for e in entries)
+        else:
+            stale = True
+        if stale or config.force:
             log.info("Creating uri.map file")
-            cnt = 0
             # also remove any uri-<client>-<pid>.map files that might be laying around
             for m in util.list_dirs(os.path.dirname(mapfile), ".map"):
                 if m == mapfile:
@@ -147,39 +200,47 @@ class DV(SwedishLegalSource):
                 util.robust_remove(m)
             util.robust_remove(mapfile + ".new")
             util.ensure_dir(mapfile)
+            # (path, basefile) pairs in the order the documents were
+            # found
+            items = []
+            paths = set()
+            for entry in entries:
+                if not entry.stat().st_size:
+                    # skip empty files
+                    continue
+                f = entry.path
+                # get basefile from f in the simplest way
+                basefile = f[len(parsed_dir) + 1:-6]
+                with open(f, "rb") as hfp:
+                    head = hfp.read(1024)
+                m = cls.re_xmlbase.search(head)
+                if m:
+                    path = urlparse(m.group(1).decode("utf-8")).path
+                    if path in paths:
+                        log.warning("Path %s is already in map" % path)
+                        continue
+                    assert path
+                    assert basefile
+                    if config.mapfiletype != "nginx":
+                        # remove prefix "/dom/" from path
+                        path = path.replace("/%s/" % cls.urispace_segment, "", 1)
+                    items.append((path, basefile))
+                    paths.add(path)
+                else:
+                    log.warning(
+                        "%s: Could not find valid head[@about] in %s" %
+                        (basefile, f))
+            if config.mapfiletype == "nginx":
+                template = "%s\t/dv/generated/%s.html;\n"
+            else:
+                template = "%s\t%s\n"
             # FIXME: Not sure utf-8 is the correct codec for us -- it
             # might be iso-8859-1 (it's to be used by mod_rewrite).
-            with codecs.open(mapfile + ".new", "w", encoding="utf-8") as fp:
-                paths = set()
-                for f in util.list_dirs(parsed_dir, ".xhtml"):
-                    if not os.path.getsize(f):
-                        # skip empty files
-                        continue
-                    # get basefile from f in the simplest way
-                    basefile = f[len(parsed_dir) + 1:-6]
-                    head = codecs.open(f, encoding='utf-8').read(1024)
-                    m = re_xmlbase.search(head)
-                    if m:
-                        path = urlparse(m.group(1)).path
-                        if path in paths:
-                            log.warning("Path %s is already in map" % path)
-                            continue
-                        assert path
-                        assert basefile
-                        if config.mapfiletype == "nginx":
-                            fp.write("%s\t/dv/generated/%s.html;\n" % (path, basefile))
-                        else:
-                            # remove prefix "/dom/" from path
-                            path = path.replace("/%s/" % cls.urispace_segment, "", 1)
-                            fp.write("%s\t%s\n" % (path, basefile))
-                        cnt += 1
-                        paths.add(path)
-                    else:
-                        log.warning(
-                            "%s: Could not find valid head[@about] in %s" %
-                            (basefile, f))
+            data = "".join([template % item for item in items]).encode("utf-8")
+            with open(mapfile + ".new", "wb") as fp:
+                fp.write(data)
             util.robust_rename(mapfile + ".new", mapfile)
-            log.info("uri.map created, %s entries" % cnt)
+            log.info("uri.map created, %s entries" % len(items))
         else:
             log.debug("Not regenerating uri.map")
             pass
@@ -192,6 +253,7 @@ class DV(SwedishLegalSource):
         opts['ftpuser'] = ''  # None  # Doesn't work great since Defaults is a typesource...
         opts['ftppassword'] = ''  # None
         opts['mapfiletype'] = 'apache' # or nginx
+        opts['downloadthreads'] = 1  # for concurrent zip fetching in download_www
         return opts
 
     def canonical_uri(self, basefile, version=None):
@@ -241,24 +303,14 @@ class DV(SwedishLegalSource):
     # override to account for the fact that there is no 1:1
     # correspondance between basefiles and uris
     def basefile_from_uri(self, uri):
-        def build_basefilemap(path, filename):
-            if self.config.mapfiletype == "nginx":
-                # chop of leading "/dom/"
-                path = path[len(self.urispace_segment)+2:]
-                # /dv/generated/HDO/T-254.html; => HDO/T-254
-                filename = filename[14:-6]
-            self._basefilemap[path] = filename
-        
         basefile = super(DV, self).basefile_from_uri(uri)
         # the "basefile" at this point is just the remainder of the
-        # URI (eg "nja/1995s362"). Create a lookup table to find the
+        # URI (eg "nja/1995s362"). Use a lookup table to find the
         # real basefile (eg "HDO/Ö463-95_1")
         if basefile:
-            if not hasattr(self, "_basefilemap"):
-                self._basefilemap = {}
-                self.readmapfile(build_basefilemap)
-            if basefile in self._basefilemap:
-                return self._basefilemap[basefile]
+            mapped = self.basefilemap.get(basefile)
+            if mapped:
+                return mapped
             else:
                 # this will happen for older cases for which we don't
                 # have any files. We invent URI-derived basefiles for
@@ -268,13 +320,33 @@ class DV(SwedishLegalSource):
 
                 # however, we check if we OUGHT to have a basefile
                 # (because it's recent enough) and warn.
-                court, year = basefile.split("/", 1)
-                year=int(year[:4])
-                if court not in self.expected_cases or self.expected_cases[court] <= year:
+                court, _, year = basefile.partition("/")
+                cutoff = self.expected_cases.get(court)
+                if cutoff is None or cutoff <= int(year[:4]):
                     self.log.warning("%s: Could not find corresponding basefile" % uri)
                 return basefile.replace(":", "/")
 
+    @cached_property
+    def basefilemap(self):
+        """Maps the URI-derived part of case URIs (eg "nja/1995s362") to
+        the corresponding basefiles (eg "HDO/Ö463-95_1"), as read
+        from the uri.map file(s)."""
+        if self.config.mapfiletype == "nginx":
+            prefixlen = len(self.urispace_segment) + 2
+            # chop of leading "/dom/" from paths, and turn
+            # "/dv/generated/HDO/T-254.html;" into "HDO/T-254"
+            return dict((path[prefixlen:], filename[14:-6])
+                        for path, filename in self._iter_mapfile())
+        else:
+            return dict(self._iter_mapfile())
+
     def readmapfile(self, callback):
+        for path, filename in self._iter_mapfile():
+            ret = callback(path, filename)
+            if ret is not None:
+                return ret
+
+    def _iter_mapfile(self):
         mapfile = self.store.path("uri", "generated", ".map")
         util.ensure_dir(mapfile)
         if self.config.clientname:
@@ -282,22 +354,20 @@ class DV(SwedishLegalSource):
         else:
             mapfiles = [mapfile]
 
-        if self.config.mapfiletype == "nginx":
-            regex = "/%s/(.*)\t/dv/generated/(.*).html;" % self.urispace_segment
-        else:
-            idx = len(self.urispace_base) + len(self.urispace_segment) + 2
-            regex = "(.*)\t(.*)"
-
-        append_path = True
         for mapfile in mapfiles:
             if os.path.exists(mapfile):
-                with codecs.open(mapfile, encoding="utf-8") as fp:
-                    for line in fp:
-                        path, filename = line.strip().split("\t", 1)
-                        ret = callback(path, filename)
-                        if ret is not None:
-                            return ret
-                        
+                # read and split the raw bytes, and only decode the
+                # fields we pass on -- much faster than going through
+                # a codecs reader line by line
+                with open(mapfile, "rb") as fp:
+                    data = fp.read()
+                for line in data.splitlines():
+                    line = line.strip()
+                    if not line:
+                        continue
+                    path, filename = line.split(b"\t", 1)
+                    yield path.decode("utf-8"), filename.decode("utf-8")
+
     def download(self, basefile=None):
         if basefile is not None:
             raise ValueError("DV.download cannot process a basefile parameter")
@@ -324,47 +394,93 @@ class DV(SwedishLegalSource):
             pass
 
     def download_ftp(self, dirname, recurse, user=None, password=None, connection=None):
-        self.log.debug('Listing contents of %s' % dirname)
-        lines = []
         if not connection:
             connection = FTP('ftp.dom.se')
             connection.login(user, password)
 
-        connection.cwd(dirname)
-        connection.retrlines('LIST', lines.append)
-
-        for line in lines:
-            parts = line.split()
-            filename = parts[-1].strip()
-            if line.startswith('d') and recurse:
-                self.download_ftp(filename, recurse, connection=connection)
-            elif line.startswith('-'):
-                basefile = os.path.splitext(filename)[0]
-                if dirname:
-                    basefile = dirname + "/" + basefile
-                # localpath = self.store.downloaded_path(basefile)
-                localpath = self.store.path(basefile, 'downloaded/zips', '.zip')
-                if os.path.exists(localpath) and not self.config.refresh:
-                    pass  # we already got this
-                else:
-                    util.ensure_dir(localpath)
-                    self.log.debug('Fetching %s to %s' % (filename,
-                                                          localpath))
-                    connection.retrbinary('RETR %s' % filename,
-                                          # FIXME: retrbinary calls .close()?
-                                          open(localpath, 'wb').write)
-                    self.process_zipfile(localpath)
+        # walk the tree depth-first, in listing order, using a stack
+        # of (dirname, remaining entries) instead of recursion. We
+        # only issue CWD when we actually move to another directory.
+        currentdir = [None]
+        def chdir(dirname):
+            if currentdir[0] != dirname:
+                connection.cwd("/" + dirname)
+                currentdir[0] = dirname
+
+        def listdir(dirname):
+            self.log.debug('Listing contents of %s' % dirname)
+            chdir(dirname)
+            return iter(self._ftp_listdir(connection))
+
+        stack = [(dirname, listdir(dirname))]
+        while stack:
+            dirname, entries = stack[-1]
+            for filename, kind in entries:
+                if kind == "dir" and recurse:
+                    subdir = dirname + "/" + filename if dirname else filename
+                    stack.append((subdir, listdir(subdir)))
+                    break
+                elif kind == "file":
+                    basefile = os.path.splitext(filename)[0]
+                    if dirname:
+                        basefile = dirname + "/" + basefile
+                    # localpath = self.store.downloaded_path(basefile)
+                    localpath = self.store.path(basefile, 'downloaded/zips', '.zip')
+                    if os.path.exists(localpath) and not self.config.refresh:
+                        pass  # we already got this
+                    else:
+                        util.ensure_dir(localpath)
+                        self.log.debug('Fetching %s to %s' % (filename,
+                                                              localpath))
+                        chdir(dirname)
+                        with open(localpath, 'wb') as fp:
+                            connection.retrbinary('RETR %s' % filename, fp.write)
+                        self.process_zipfile(localpath)
+            else:
+                stack.pop()
         connection.cwd('/')
 
+    def _ftp_listdir(self, connection):
+        """Returns a list of (name, kind) tuples for the current directory
+        of *connection*, where kind is "dir", "file" or something else
+        (eg. None or "cdir"), using MLSD if the server supports it."""
+        if getattr(self, '_ftp_has_mlsd', True):
+            try:
+                return [(name, facts.get("type"))
+                        for name, facts in connection.mlsd(facts=["type"])]
+            except (AttributeError, error_perm):
+                # py2 ftplib has no mlsd, and some servers don't support it
+                self._ftp_has_mlsd = False
+        lines = []
+        connection.retrlines('LIST', lines.append)
+        return [(line.split()[-1].strip(), {"d": "dir", "-": "file"}.get(line[:1]))
+                for line in lines]
+
     def download_www(self, dirname, recurse):
         url = 'https://lagen.nu/dv/downloaded/%s' % dirname
         self.log.debug('Listing contents of %s' % url)
-        resp = requests.get(url)
-        iterlinks = lxml.html.document_fromstring(resp.text).iterlinks()
-        for element, attribute, link, pos in iterlinks:
-            if link.startswith("/"):
-                continue
-            elif link.endswith("/") and recurse:
+        # the listings are plain directory indexes, so we only need
+        # the <a href> values -- stream them out of the response
+        # instead of building a complete tree first. Subdirectories
+        # are visited once the listing has been read, so that each
+        # level of recursion doesn't hold on to a connection.
+        links = []
+        with closing(self.session.get(url, stream=True)) as resp:
+            resp.raw.decode_content = True
+            for event, element in etree.iterparse(resp.raw, events=("end",), tag="a", html=True):
+                link = element.get("href")
+                element.clear()
+                if link is not None and not link.startswith("/"):
+                    links.append(link)
+        # zip files are fetched (possibly concurrently, see
+        # downloadthreads) in batches, but written to disk and
+        # processed one at a time in the order they're listed, as
+        # later zips may replace documents from earlier ones.
+        pending = []
+        for link in links:
+            if link.endswith("/") and recurse:
+                self._fetch_zipfiles(pending)
+                pending = []
                 self.download_www(link, recurse)
             elif link.endswith(".zip"):
                 basefile = os.path.splitext(link)[0]
@@ -376,12 +492,58 @@ class DV(SwedishLegalSource):
                 if os.path.exists(localpath) and not self.config.refresh:
                     pass  # we already got this
                 else:
-                    absolute_url = urljoin(url, link)
-                    self.log.debug('Fetching %s to %s' % (link, localpath))
-                    resp = requests.get(absolute_url)
-                    with self.store.open(basefile, "downloaded/zips", ".zip", "wb") as fp:
-                        fp.write(resp.content)
-                    self.process_zipfile(localpath)
+                    pending.append((basefile, localpath, link, urljoin(url, link)))
+        self._fetch_zipfiles(pending)
+
+    def _fetch_zipfiles(self, zips):
+        """Fetch and process a list of zip files, given as (basefile,
+        localpath, link, absolute_url) tuples."""
+        threads = int(self.config.downloadthreads)
+        if (threads > 1 and len(zips) > 1 and
+                not ('downloadmax' in self.config and self.config.downloadmax)):
+            from concurrent.futures import ThreadPoolExecutor
+            zips = iter(zips)
+            inflight = deque()
+            try:
+                with ThreadPoolExecutor(max_workers=threads) as executor:
+                    # only keep as many downloads going as there are
+                    # threads, so that finished but not yet processed
+                    # zips don't pile up on disk
+                    for z in itertools.islice(zips, threads):
+                        inflight.append((z, executor.submit(self._fetch_zipfile, z)))
+                    while inflight:
+                        z, future = inflight[0]
+                        future.result()
+                        inflight.popleft()
+                        for nextz in itertools.islice(zips, 1):
+                            inflight.append((nextz, executor.submit(self._fetch_zipfile, nextz)))
+                        self._store_zipfile(z)
+            finally:
+                # if we stopped early (eg MaxDownloadsReached), remove
+                # the zips that were fetched but never processed
+                for z, future in inflight:
+                    util.robust_remove(z[1] + ".part")
+        else:
+            for z in zips:
+                self._fetch_zipfile(z)
+                self._store_zipfile(z)
+
+    def _fetch_zipfile(self, z):
+        # streams the zip to a ".part" file next to its final
+        # location. _store_zipfile moves it into place once it's
+        # this zip's turn to be processed.
+        basefile, localpath, link, absolute_url = z
+        self.log.debug('Fetching %s to %s' % (link, localpath))
+        util.ensure_dir(localpath)
+        with closing(self.session.get(absolute_url, stream=True)) as resp:
+            with open(localpath + ".part", "wb") as fp:
+                for chunk in resp.iter_content(chunk_size=64 * 1024):
+                    fp.write(chunk)
+
+    def _store_zipfile(self, z):
+        basefile, localpath, link, absolute_url = z
+        util.robust_rename(localpath + ".part", localpath)
+        self.process_zipfile(localpath)
 
     # eg. HDO_T3467-96.doc or HDO_T3467-96_1.doc
     re_malnr = re.compile(r'([^_]*)_([^_\.]*)()_?(\d*)(\.docx?)')
@@ -393,6 +555,12 @@ class DV(SwedishLegalSource):
         r'([^_]*)_([^_\.]*)_?(\d*)_BYTUT_\d+-\d+-\d+_?(\d*)(\.docx?)')
     re_tabort_malnr = re.compile(
         r'([^_]*)_([^_\.]*)_?(\d*)_TABORT_\d+-\d+-\d+_?(\d*)(\.docx?)')
+    # all of the above in one pattern, with the kind of entry (bytut,
+    # tabort or plain) as the name of the outermost group. Each
+    # alternative has the same five groups.
+    re_docname = re.compile("|".join(
+        "(?P<%s>%s)" % (kind, regex.pattern) for kind, regex in
+        (("bytut", re_bytut_malnr), ("tabort", re_tabort_malnr), ("plain", re_malnr))))
 
     # temporary helper
     @action
@@ -418,7 +586,12 @@ class DV(SwedishLegalSource):
         except zipfile.BadZipfile as e:
             self.log.error("%s is not a valid zip file: %s" % (zipfilename, e))
             return
-        for bname in zipf.namelist():
+        for zi in zipf.infolist():
+            bname = zi.filename
+            if bname.endswith("/"):
+                # a directory entry (what ZipInfo.is_dir() checks on
+                # py3.6+) -- nothing to extract
+                continue
             if not isinstance(bname, str):  # py2
                 # Files in the zip file are encoded using codepage 437
                 name = bname.decode('cp437')
@@ -432,10 +605,9 @@ class DV(SwedishLegalSource):
                 # creating an actual permanent file, but let
                 # extract_notis extract individual parts of this file
                 # to individual basefiles
-                fp = tempfile.NamedTemporaryFile("wb", suffix=suffix, delete=False)
-                filebytes = zipf.read(bname)
-                fp.write(filebytes)
-                fp.close()
+                with zipf.open(zi) as src, tempfile.NamedTemporaryFile(
+                        "wb", suffix=suffix, delete=False) as fp:
+                    shutil.copyfileobj(src, fp)
                 tempname = fp.name
                 r = self.extract_notis(tempname, year, coll)
                 assert r[0] + r[1], "No notices extracted from %s in %s" % (bname, zipfilename)
@@ -443,16 +615,13 @@ class DV(SwedishLegalSource):
                 untouched += r[1]
                 os.unlink(tempname)
             else:
-                name = os.path.split(name)[1]
-                if 'BYTUT' in name:
-                    m = self.re_bytut_malnr.match(name)
-                elif 'TABORT' in name:
-                    m = self.re_tabort_malnr.match(name)
-                else:
-                    m = self.re_malnr.match(name)
+                # member names always use / as separator
+                name = name.rpartition("/")[2]
+                m = self.re_docname.match(name)
                 if m:
-                    (court, malnr, opt_referatnr, referatnr, suffix) = (
-                        m.group(1), m.group(2), m.group(3), m.group(4), m.group(5))
+                    kind = m.lastgroup
+                    idx = m.lastindex
+                    (court, malnr, opt_referatnr, referatnr, suffix) = m.groups()[idx:idx + 5]
                     assert ((suffix == ".doc") or (suffix == ".docx")
                             ), "Unknown suffix %s in %r" % (suffix, name)
                     if referatnr:
@@ -466,7 +635,7 @@ class DV(SwedishLegalSource):
 
                     outfile = self.store.path(basefile, 'downloaded', suffix)
 
-                    if "TABORT" in name:
+                    if kind == "tabort":
                         self.log.info("%s: Removing" % basefile)
                         if not os.path.exists(outfile):
                             self.log.warning("%s: %s doesn't exist" % (basefile,
@@ -474,7 +643,7 @@ class DV(SwedishLegalSource):
                         else:
                             os.unlink(outfile)
                         removed += 1
-                    elif "BYTUT" in name:
+                    elif kind == "bytut":
                         self.log.info("%s: download OK (replacing with new)" % basefile)
                         if not os.path.exists(outfile):
                             self.log.warning("%s: %s doesn't exist" %
@@ -487,15 +656,16 @@ class DV(SwedishLegalSource):
                             continue
                         else:
                             created += 1
-                    if not "TABORT" in name:
-                        data = zipf.read(bname)
-                        with self.store.open(basefile, "downloaded", suffix, "wb") as fp:
-                            fp.write(data)
+                    if kind != "tabort":
+                        with zipf.open(zi) as src, self.store.open(
+                                basefile, "downloaded", suffix, "wb") as fp:
+                            shutil.copyfileobj(src, fp)
 
                         # Make the unzipped files have correct timestamp
-                        zi = zipf.getinfo(bname)
-                        dt = datetime(*zi.date_time)
-                        ts = mktime(dt.timetuple())
+                        # (date_time is a naive local time 6-tuple;
+                        # pad it to a struct_time-like 9-tuple with
+                        # isdst=-1, like datetime.timetuple() would)
+                        ts = mktime(zi.date_time + (0, 0, -1))
                         os.utime(outfile, (ts, ts))
 
                         self.downloadcount += 1
@@ -530,7 +700,8 @@ class DV(SwedishLegalSource):
             avd_p = None
             if os.path.exists(prev_path):
                 with self.store.open_intermediate(prev_basefile, "rb") as fp:
-                    soup = BeautifulSoup(fp.read(), "lxml")
+                    soup = BeautifulSoup(fp.read(), "lxml",
+                                         parse_only=SoupStrainer(["w:p", "para"]))
                 tmp = soup.find(["w:p", "para"])
                 if re_avdstart.match(tmp.get_text().strip()):
                     avd_p = tmp
@@ -547,38 +718,45 @@ class DV(SwedishLegalSource):
         # opened since parse_open will prefer the constructed
         # intermediate file.
         if coll == "HDO":
-            re_notisstart = re.compile(
-                "(?P<day>Den\s+\d+\s*:[ae].\s+|)(?P<ordinal>\d+)\s*\.\s*\((?P<malnr>\w\s\d+-\d+)\)",
-                flags=re.UNICODE)
-            re_avdstart = re.compile(
-                "(Januari|Februari|Mars|April|Maj|Juni|Juli|Augusti|September|Oktober|November|December)$")
+            re_notisstart = self.re_notisstart_hdo
+            re_avdstart = self.re_avdstart_hdo
         else:  # REG / HFD
             if int(year) < 2016:
-                re_notisstart = re.compile(
-                    "[\w\: ]*Lnr:(?P<court>\w+) ?(?P<year>\d+) ?not ?(?P<ordinal>\d+)",
-                    flags=re.UNICODE)
+                re_notisstart = self.re_notisstart_hfd
             else:
-                re_notisstart = re.compile("Not (?P<ordinal>\d+)$")
+                re_notisstart = self.re_notisstart_hfd_2016
             re_avdstart = None
         created = untouched = 0
-        intermediatefile = os.path.splitext(docfile)[0] + ".xml"
-        with open(intermediatefile, "wb") as fp:
-            filetype = WordReader().read(docfile, fp)
-        
-        soup = BeautifulSoup(util.readfile(intermediatefile), "lxml")
-        os.unlink(intermediatefile) # won't be needed past this point
+        # the converted document is only needed in memory
+        intermediate = BytesIO()
+        filetype = WordReader().read(docfile, intermediate)
+
         if filetype == "docx":
             p_tag = "w:p"
             xmlns = ' xmlns:w14="http://schemas.microsoft.com/office/word/2010/wordml" xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"'
         else:
             p_tag = "para"
             xmlns = ''
-        iterator = soup.find_all(p_tag, limit=2147483647)
+        # we're only interested in paragraphs, so don't let
+        # BeautifulSoup build objects for anything else
+        soup = BeautifulSoup(intermediate.getvalue().decode("utf-8"), "lxml",
+                             parse_only=SoupStrainer(p_tag))
+        # each paragraph is followed by a newline, except in OOXML
+        sep = b"" if filetype == "docx" else b"\n"
+        def write_notis(basefile, parts):
+            parts.append(b"</body>\n")
+            # (the store creates the directory when the file is closed)
+            with self.store.open_intermediate(basefile, mode="wb") as fp:
+                fp.write(b"".join(parts))
+
+        iterator = soup.find_all(p_tag)
+        # all notis in a file normally go in the same directory, so
+        # only make sure it exists once
+        ensured_dirs = set()
         basefile = None
-        fp = None
+        parts = None  # serialized parts of the current notis
         avd_p = None
         day = None
-        intermediate_path = None
         for p in iterator:
             t = p.get_text().strip()
             if re_avdstart:
@@ -607,37 +785,32 @@ class DV(SwedishLegalSource):
                 except IndexError:
                     pass
 
-                if intermediate_path:
-                    previous_intermediate_path = intermediate_path
+                if parts is not None:
+                    # the previous notis is complete (and needs to be
+                    # on disk for find_month_in_previous)
+                    write_notis(basefile, parts)
                 basefile = "%(coll)s/%(year)s_not_%(ordinal)s" % locals()
                 self.log.info("%s: Extracting from %s file" % (basefile, filetype))
                 created += 1
                 downloaded_path = self.store.path(basefile, 'downloaded', '.' + filetype)
-                util.ensure_dir(downloaded_path)
+                downloaded_dir = os.path.dirname(downloaded_path)
+                if downloaded_dir not in ensured_dirs:
+                    util.ensure_dir(downloaded_path)
+                    ensured_dirs.add(downloaded_dir)
                 with open(downloaded_path, "w"):
                     pass  # just create an empty placeholder file --
                           # parse_open will load the intermediate file
                           # anyway.
-                if fp:
-                    fp.write(b"</body>\n")
-                    fp.close()
-                util.ensure_dir(self.store.intermediate_path(basefile))
-                fp = self.store.open_intermediate(basefile, mode="wb")
                 bodytag = '<body%s>' % xmlns 
-                fp.write(bodytag.encode("utf-8"))
-                if filetype != "docx":
-                    fp.write(b"\n")
+                parts = [bodytag.encode("utf-8") + sep]
                 if coll == "HDO" and not avd_p:
                     avd_p = find_month_in_previous(basefile)
                 if avd_p:
-                    fp.write(str(avd_p).encode("utf-8"))
-            if fp:
-                fp.write(str(p).encode("utf-8"))
-                if filetype != "docx":
-                    fp.write(b"\n")
-        if fp:  # should always be the case
-            fp.write(b"</body>\n")
-            fp.close()
+                    parts.append(str(avd_p).encode("utf-8"))
+            if parts is not None:
+                parts.append(str(p).encode("utf-8") + sep)
+        if parts is not None:  # should always be the case
+            write_notis(basefile, parts)
         else:
             self.log.error("%s/%s: No notis were extracted (%s)" %
                            (coll, year, docfile))
@@ -662,6 +835,15 @@ class DV(SwedishLegalSource):
     def adjust_basefile(self, doc, orig_uri):
         pass # See comments in swedishlegalsource.py 
 
+    # maps the first six bytes of an intermediate file to the type of
+    # document it was created from (notisfall extracted by
+    # extract_notis start with <body>, see its use of xmlns)
+    intermediate_filetypes = {b"<w:doc": "docx",
+                              b"<body ": "docx",
+                              b"<book ": "doc",
+                              b"<book>": "doc",
+                              b"<body>": "doc"}
+
     def parse_open(self, basefile, attachment=None, version=None):
         intermediate_path = self.store.intermediate_path(basefile)
         if not os.path.exists(intermediate_path):
@@ -673,11 +855,8 @@ class DV(SwedishLegalSource):
             # first bytes.
             start = fp.read(6)
             assert isinstance(start, bytes), "fp seems to have been opened in a text-like mode"
-            if start in (b"<w:doc", b"<body "):
-                filetype = "docx"
-            elif start in (b"<book ", b"<book>", b"<body>"):
-                filetype = "doc"
-            else:
+            filetype = self.intermediate_filetypes.get(start)
+            if filetype is None:
                 raise ValueError("Can't guess filetype from %r" % start)
             fp.seek(0)
             self.filetype = filetype
@@ -692,16 +871,32 @@ class DV(SwedishLegalSource):
                                     "been created by download() but is missing!" %
                                     (basefile, docfile, intermediatefile))
         wr = WordReader()
-        fp = self.store.open_intermediate(basefile, mode="wb")
-        self.filetype = wr.read(docfile, fp, simplify=True)
+        # convert into memory, then save a (possibly compressed) copy
+        # as the intermediate file and return the in-memory version,
+        # so that we don't have to re-open and decompress what we
+        # just wrote
+        intermediate = BytesIO()
+        self.filetype = wr.read(docfile, intermediate, simplify=True)
         # FIXME: Do something with filetype if it's not what we expect
-        fp.close()
-        if hasattr(fp, 'utime'):
-            os.utime(self.store.intermediate_path(basefile), (fp.utime, fp.utime))
-        # re-open in read mode -- since we can't open a compressed
-        # file in read-write mode
-        return self.store.open_intermediate(basefile, mode="rb")
-        
+        with self.store.open_intermediate(basefile, mode="wb") as fp:
+            fp.write(intermediate.getvalue())
+        if hasattr(intermediate, 'utime'):
+            os.utime(self.store.intermediate_path(basefile),
+                     (intermediate.utime, intermediate.utime))
+        intermediate.seek(0)
+        return intermediate
+
+
+    # the collection, year and ordinal of basefiles like
+    # "HDO/2007_not_19" or "ADO/2013-63"
+    re_basefile_parts = re.compile(
+        r"(?P<type>\w+)/(?P<year>\d+)(?:_not_|-)(?P<ordinal>\d+)")
+
+    def basefile_parts(self, basefile):
+        # returns the type, year and ordinal of basefile as a dict
+        # (empty if it's not one of the forms above)
+        m = self.re_basefile_parts.match(basefile)
+        return m.groupdict() if m else {}
 
     def extract_head(self, fp, basefile):
         filetype = self.filetype
@@ -736,6 +931,16 @@ class DV(SwedishLegalSource):
     def extract_body(self, fp, basefile):
         return self._rawbody
 
+    # patterns used by sanitize_body
+    re_ordered_paragraph = re.compile(r"\d\.\s+[A-ZÅÄÖ]")
+    re_smushed_number = re.compile(r"^(\d{1,3})([A-ZÅÄÖ])")
+    smushed_headings = ("KÄRANDE", "SVARANDE", "SAKEN")
+    uppercase_letters = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZÅÄÖ")
+    re_smushed_delmal = re.compile(r"(.*[\.\) ])(I+)$", re.DOTALL)
+    re_mellandomstema = re.compile(r"mellandomstema I+$", re.IGNORECASE)
+    re_delmal = re.compile(r"(I{1,3}|IV)\.? ?(|\(\w+\-\d+\))$")
+    sentence_end_chars = frozenset(".?0123456789")
+
     def sanitize_body(self, rawbody):
         result = []
         seen_delmal = {}
@@ -747,19 +952,28 @@ class DV(SwedishLegalSource):
         # starting with "Ledamöter: " do NOT exhibit this trait... Try
         # to detect and undo.
         if (isinstance(rawbody[0], str) and  # Notisfall rawbody is a list of lists...
-            max(len(line) for line in rawbody if not line.startswith("Ledamöter: ")) < 60):
+            not any(len(line) >= 60 for line in rawbody if not line.startswith("Ledamöter: "))):
             self.log.warning("Source has double newlines between every line, attempting "
                              "to reconstruct sections")
             newbody = []
             currentline = ""
+            # each line is checked against the next, so compute the
+            # per-line properties once up front. NB: str.isupper()
+            # returns at the first lower-case character, so it's
+            # already cheap for ordinary text lines. Note that a
+            # first-character check can't be used to rule lines out,
+            # since eg "1. SAKEN" is upper-case.
+            upper = [line.isupper() for line in rawbody]
+            ordered = [bool(self.re_ordered_paragraph.match(line)) for line in rawbody]
+            last = len(rawbody) - 1
             for idx, line in enumerate(rawbody):
-                if (line.isupper() or # this is a obvious header
-                    (idx + 1 < len(rawbody) and rawbody[idx+1].isupper()) or # next line is a obvious header
-                    (idx + 1 < len(rawbody) and # line is short and a probable sentence enter + next line starts with a new sentence 
+                if (upper[idx] or # this is a obvious header
+                    (idx < last and upper[idx+1]) or # next line is a obvious header
+                    (idx < last and # line is short and a probable sentence enter + next line starts with a new sentence 
                      len(line) < 45 and
-                     line[-1] in (".", "?", "0", "1", "2", "3", "4", "5", "6", "7", "8", "9") and
+                     line[-1] in self.sentence_end_chars and
                      rawbody[idx+1][0].isupper()) or
-                    (idx + 1 < len(rawbody) and re.match("\d\.\s+[A-ZÅÄÖ]", rawbody[idx+1])) # next line seem to be a ordered paragraph
+                    (idx < last and ordered[idx+1]) # next line seem to be a ordered paragraph
                     ):
                     newbody.append(currentline + "\n" + line)
                     currentline = ""
@@ -771,13 +985,17 @@ class DV(SwedishLegalSource):
                 # detect and fix smushed numbered sections which MD
                 # has, eg "18Marknadsandelar är..." ->
                 # "18. Marknadsandelar är..."
-                x = re.sub("^(\d{1,3})([A-ZÅÄÖ])", r"\1. \2", x)
-
-                m = re.match("(KÄRANDE|SVARANDE|SAKEN)([A-ZÅÄÖ].*)", x) 
-                if m:
-                    # divide smushed-together headings like MD has,
-                    # eg. "SAKENMarknadsföring av bilverkstäder..."
-                    x = [m.group(1), m.group(2)]
+                x = self.re_smushed_number.sub(r"\1. \2", x)
+
+                for heading in self.smushed_headings:
+                    if (x.startswith(heading) and
+                            x[len(heading):len(heading) + 1] in self.uppercase_letters):
+                        # divide smushed-together headings like MD has,
+                        # eg. "SAKENMarknadsföring av bilverkstäder..."
+                        # (only up to the first newline, like the regex
+                        # previously used for this did)
+                        x = [heading, x[len(heading):].split("\n", 1)[0]]
+                        break
                 else:
                     # match smushed-together delmål markers like in "(jfr
                     # 1990 s 772 och s 796)I" and "Domslut HD fastställer
@@ -788,14 +1006,20 @@ class DV(SwedishLegalSource):
                     # "...och Dalarna. I\ndistributionsrörelsen
                     # sysselsattes...". Try to avoid this by checking for
                     # probable sentence start in next line
-                    m = re.match("(.*[\.\) ])(I+)$", x, re.DOTALL)
+                    m = self.re_smushed_delmal.match(x)
                     if (m and rawbody[idx+1][0].isupper() and
-                        not re.search("mellandomstema I+$", x, flags=re.IGNORECASE)):
+                        not self.re_mellandomstema.search(x)):
                         x = [m.group(1), m.group(2)]
-                    else:
-                        x = [x]
+                if isinstance(x, str):
+                    # the common case: the chunk wasn't split, so
+                    # don't build a throwaway list just to loop over it
+                    m = self.re_delmal.match(x)
+                    if m:
+                        seen_delmal[m.group(1)] = True
+                    result.append(Paragraph([x]))
+                    continue
                 for p in x:
-                    m = re.match("(I{1,3}|IV)\.? ?(|\(\w+\-\d+\))$", p)
+                    m = self.re_delmal.match(p)
                     if m:
                         seen_delmal[m.group(1)] = True
                     result.append(Paragraph([p]))
@@ -832,8 +1056,31 @@ class DV(SwedishLegalSource):
             buffer = None
             
     
+    # patterns used by parse_not. The notisstart patterns should be
+    # kept in sync with the ones used by extract_notis
+    re_notis_hdo = re.compile(
+        r"(?:Den (?P<avgdatum>\d+)\s*:[ae].\s+|)(?P<ordinal>\d+)\s*\.\s*\((?P<malnr>\w[ \xa0]\d+-\d+)\)",
+        flags=re.UNICODE)
+    re_notis_first_sentence = re.compile(r"\. [A-ZÅÄÖ]")
+    # The following patterns are searched for in every header
+    # line. If re2 is installed, they're compiled with it, which
+    # guarantees matching in linear time. They only use features
+    # that work the same in re2 (which, eg, doesn't have a
+    # unicode-aware \w), and use the inline (?s) instead of
+    # flags=re.DOTALL.
+    re_notis_malnr = (re2 or re).compile(r"[AD][:-] ?(?P<malnr>\d+\-\d+)")
+    # the avgdatum regex attempts to include valid dates, eg not
+    # "2770-71-12".It's also somewhat tolerant of formatting
+    # mistakes, eg accepts " :03-06-16" instead of "A:03-06-16"
+    re_notis_avgdatum = (re2 or re).compile(r"[AD ]: ?(?P<avgdatum>\d{2,4}\-[01]\d\-\d{2})")
+    re_notis_sokord = (re2 or re).compile(r"(?s)Uppslagsord: ?(?P<sokord>.*)")
+    re_notis_lagrum = (re2 or re).compile(r"(?s)Lagrum: ?(?P<lagrum>.*)")
+    re_notis_malnr_2016 = re.compile(r"Högsta förvaltningsdomstolen meddelade( den|) (?P<avgdatum>\d+ \w+ \d{4}) (följande |)(?P<avgtyp>dom|beslut) \((mål nr |)(?P<malnr>[\d\-–]+(| och [\d\-–]+))\)")
+    re_notis_header = re.compile(r"Not(is|)\.? \d+[abc]?\.? ?")
+    re_notis_header_2016 = re.compile(r"Not \d+$")
+    re_notis_header_prefix = re.compile(r"Not(is|)\.? \d+[abc]?\.? ")
+
     def parse_not(self, text, basefile, filetype):
-        basefile_regex = re.compile("(?P<type>\w+)/(?P<year>\d+)_not_(?P<ordinal>\d+)")
         referat_templ = {'REG': 'RÅ %(year)s not %(ordinal)s',
                          'HDO': 'NJA %(year)s not %(ordinal)s',
                          'HFD': 'HFD %(year)s not %(ordinal)s'}
@@ -841,7 +1088,7 @@ class DV(SwedishLegalSource):
         head = {}
         body = []
 
-        m = basefile_regex.match(basefile).groupdict()
+        m = self.basefile_parts(basefile)
         coll = m['type']
         year = int(m['year'])
         head["Referat"] = referat_templ[coll] % m
@@ -852,21 +1099,22 @@ class DV(SwedishLegalSource):
         else:
             ptag = "para", "w:p"
 
-        iterator = soup.find_all(ptag, limit=2147483647)
+        iterator = iter(soup.find_all(ptag))
         if coll == "HDO":
-            # keep this in sync w extract_notis
-            re_notisstart = re.compile(
-                "(?:Den (?P<avgdatum>\d+)\s*:[ae].\s+|)(?P<ordinal>\d+)\s*\.\s*\((?P<malnr>\w[ \xa0]\d+-\d+)\)",
-                flags=re.UNICODE)
-            re_avgdatum = re_malnr = re_notisstart
+            re_avgdatum = re_malnr = self.re_notis_hdo
             re_lagrum = re_sokord = None
             # headers consist of the first two chunks. (month, then
             # date+ordinal+malnr)
-            header = iterator.pop(0), iterator[0]  # need to re-read the second line later
+            # (node, text) pairs, so that the text of each node is
+            # only extracted once
+            first, second = next(iterator), next(iterator)
+            header = [(node, node.get_text().strip()) for node in (first, second)]
+            # need to re-read the second line later
+            iterator = itertools.chain([second], iterator)
             curryear = m['year']
-            currmonth = self.swedish_months[header[0].get_text().strip().lower()]
-            secondline = util.normalize_space(header[-1].get_text())
-            m = re_notisstart.match(secondline)
+            currmonth = self.swedish_months[header[0][1].lower()]
+            secondline = util.normalize_space(header[-1][1])
+            m = self.re_notis_hdo.match(secondline)
             if m:
                 head["Rubrik"] = secondline[m.end():].strip()
                 if curryear == "2003":  # notisfall in this year lack
@@ -874,32 +1122,24 @@ class DV(SwedishLegalSource):
                                         # actual text, so we use a
                                         # heuristic to just match
                                         # first sentence
-                    m2 = re.search("\. [A-ZÅÄÖ]", head["Rubrik"])
+                    m2 = self.re_notis_first_sentence.search(head["Rubrik"])
                     if m2:
                         # now we know where the first sentence ends. Only keep that. 
                         head["Rubrik"] = head["Rubrik"][:m2.start()+1]
                                       
         else:  # "REG", "HFD"
-            # keep in sync like above
             if year < 2016:
-                re_notisstart = re.compile(
-                    "[\w\: ]*Lnr:(?P<court>\w+) ?(?P<year>\d+) ?not ?(?P<ordinal>\d+)")
-                re_malnr = re.compile(r"[AD][:-] ?(?P<malnr>\d+\-\d+)")
-                # the avgdatum regex attempts to include valid dates, eg
-                # not "2770-71-12".It's also somewhat tolerant of
-                # formatting mistakes, eg accepts " :03-06-16" instead of
-               # "A:03-06-16"
-                re_avgdatum = re.compile(r"[AD ]: ?(?P<avgdatum>\d{2,4}\-[01]\d\-\d{2})")
-                re_sokord = re.compile("Uppslagsord: ?(?P<sokord>.*)", flags=re.DOTALL)
-                re_lagrum = re.compile("Lagrum: ?(?P<lagrum>.*)", flags=re.DOTALL)
+                re_malnr = self.re_notis_malnr
+                re_avgdatum = self.re_notis_avgdatum
+                re_sokord = self.re_notis_sokord
+                re_lagrum = self.re_notis_lagrum
             else:
-                re_notisstart = re.compile("Not (?P<ordinal>\d+)")
-                re_malnr = re.compile("Högsta förvaltningsdomstolen meddelade( den|) (?P<avgdatum>\d+ \w+ \d{4}) (följande |)(?P<avgtyp>dom|beslut) \((mål nr |)(?P<malnr>[\d\-–]+(| och [\d\-–]+))\)")
-                re_avgdatum = re_malnr
+                re_malnr = re_avgdatum = self.re_notis_malnr_2016
                 re_sokord = None
                 re_lagrum = None
             # headers consists of the first five or six
-            # chunks. Doesn't end until "^Not \d+."
+            # chunks. Doesn't end until "^Not \d+." Like above, this
+            # is a list of (node, text) pairs
             header = []
             done = False
             print("Maybe testing the new code")
@@ -911,7 +1151,7 @@ class DV(SwedishLegalSource):
                 # space separating the notis from the next sentence,
                 # but there might also not be!
                 # Also, avoid matchin the very first line of 2016+ style headers
-                if re.match("Not(is|)\.? \d+[abc]?\.? ?", line) and not re.match("Not \d+$", line):
+                if self.re_notis_header.match(line) and not self.re_notis_header_2016.match(line):
                     # this means a 2015 or earlier header
                     done = True
                     if ". -" in line[:2000]:
@@ -919,7 +1159,7 @@ class DV(SwedishLegalSource):
                         # sentence up to ". -", signalling that is the
                         # equiv of referatrubrik
                         rubr = line.split(". -", 1)[0]
-                        rubr = re.sub("Not(is|)\.? \d+[abc]?\.? ", "", rubr)
+                        rubr = self.re_notis_header_prefix.sub("", rubr)
                         head['Rubrik'] = rubr
                     else:
                         if line.endswith("Notisen har utgått."):
@@ -937,15 +1177,18 @@ class DV(SwedishLegalSource):
                         m = re_malnr.match(line)
                         head['Rubrik'] = ("%(avgtyp)s den %(avgdatum)s i mål %(malnr)s" % m).capitalize()
                         done = True
-                    if tmp.get_text().strip():
+                    tmptext = tmp.get_text().strip()
+                    if tmptext:
                         # REG specialcase
-                        if header and header[-1].get_text().strip() == "Lagrum:":
+                        if header and header[-1][1] == "Lagrum:":
                             # get the first bs4.element.Tag child
                             children = [x for x in tmp.children if hasattr(x, 'get_text')]
                             if children:
-                                header[-1].append(children[0])
+                                lagrum = header[-1][0]
+                                lagrum.append(children[0])
+                                header[-1] = (lagrum, lagrum.get_text().strip())
                         else:
-                            header.append(tmp)
+                            header.append((tmp, tmptext))
             if not done:
                 raise errors.ParseError("Cannot find notis number in %s" % basefile)
 
@@ -957,8 +1200,8 @@ class DV(SwedishLegalSource):
             head['Domstol'] = "Regeringsrätten"
         else:
             raise errors.ParseError("Unsupported: %s" % coll)
-        for node in header:
-            t = util.normalize_space(node.get_text())
+        for node, text in header:
+            t = util.normalize_space(text)
             # if not malnr, avgdatum found, look for those
             for fld, key, rex in (('Målnummer', 'malnr', re_malnr),
                                   ('Avgörandedatum', 'avgdatum', re_avgdatum),
@@ -981,11 +1224,13 @@ class DV(SwedishLegalSource):
         #
         # This is generic enough that it could be part of WordReader
         for node in iterator:
-            line = []
+            # consecutive parts with the same formatting are collected
+            # as (kind, [text, ...]) runs and joined afterwards
+            runs = []
             if filetype == "doc":
                 subiterator = node
             elif filetype == "docx":
-                subiterator = node.find_all("w:r", limit=2147483647)
+                subiterator = node.find_all("w:r")
             for part in subiterator:
                 if part.name:
                     t = part.get_text()
@@ -993,61 +1238,154 @@ class DV(SwedishLegalSource):
                     t = str(part)  # convert NavigableString to pure string
                 # if not t.strip():
                 #     continue
+                kind = None
                 if filetype == "doc" and part.name == "emphasis":  # docbook
-                    if part.get("role") == "bold":
-                        if line and isinstance(line[-1], Strong):
-                            line[-1][-1] += t
-                        else:
-                            line.append(Strong([t]))
-                    else:
-                        if line and isinstance(line[-1], Em):
-                            line[-1][-1] += t
-                        else:
-                            line.append(Em([t]))
-                # ooxml
-                elif filetype == "docx" and part.find("w:rpr") and part.find("w:rpr").find(["w:b", "w:i"]):
+                    kind = Strong if part.get("role") == "bold" else Em
+                elif filetype == "docx":  # ooxml
                     rpr = part.find("w:rpr")
-                    if rpr.find("w:b"):
-                        if line and isinstance(line[-1], Strong):
-                            line[-1][-1] += t
-                        else:
-                            line.append(Strong([t]))
-                    elif rpr.find("w:i"):
-                        if line and isinstance(line[-1], Em):
-                            line[-1][-1] += t
-                        else:
-                            line.append(Em([t]))
+                    if rpr:
+                        if rpr.find("w:b"):
+                            kind = Strong
+                        elif rpr.find("w:i"):
+                            kind = Em
+                if runs and runs[-1][0] is kind:
+                    runs[-1][1].append(t)
                 else:
-                    if line and isinstance(line[-1], str):
-                        line[-1] += t
-                    else:
-                        line.append(t)
+                    runs.append((kind, [t]))
+            line = []
+            for kind, fragments in runs:
+                t = "".join(fragments)
+                line.append(kind([t]) if kind else t)
             if line:
-                body.append(util.normalize_space(x) for x in line)
+                # Strong/Em runs are kept as-is
+                body.append([util.normalize_space(x) if isinstance(x, str) else x
+                             for x in line])
         return head, body
 
 
+    # all labels of metadata fields in the header and footer of a
+    # referat, see find_labels
+    header_labels = set(labels) | set(["Lagrum", "Rättsfall", "Sökord", "Litteratur"])
+
+    ooxml_ns = {'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'}
+
+    def parse_xml(self, text):
+        if isinstance(text, str):
+            text = text.encode("utf-8")
+        return etree.fromstring(text, parser=etree.XMLParser(recover=True))
+
+    def is_label(self, s, label):
+        # True if the text node s contains label, in the same way as
+        # the find(text=re.compile(...)) calls that find_labels
+        # replaces: a substring search for "Label:", except for
+        # Litteratur which must be the only text in its node.
+        if label == "Litteratur":
+            return s.strip() == "Litteratur:"
+        return label + ":" in s
+
+    def find_labels(self, root, labels, marker=None):
+        # Finds the element containing the first text node matching
+        # each of the given labels (see is_label), and, if given, the
+        # first text node containing marker, in a single pass over
+        # the document.
+        found = {}
+        for s in root.xpath("//text()"):
+            keys = []
+            if marker and marker not in found and marker in s:
+                keys.append(marker)
+            if ":" in s:
+                keys.extend(label for label in labels
+                            if label not in found and self.is_label(s, label))
+            if keys:
+                parent = s.getparent()
+                node = parent.getparent() if s.is_tail else parent
+                for key in keys:
+                    found[key] = node
+        return found
+
+    def get_text(self, node):
+        # the lxml equivalent of BeautifulSoup's get_text(strip=True)
+        return "".join(s.strip() for s in node.itertext())
+
     def parse_ooxml(self, text, basefile):
-        soup = BeautifulSoup(text, "lxml")
+        if isinstance(text, str):
+            text = text.encode("utf-8")
+        ns = self.ooxml_ns
+        w_t = "{%s}t" % ns['w']
+        w_p = "{%s}p" % ns['w']
+        w_tr = "{%s}tr" % ns['w']
+
+        # The main text body of the verdict is the table row
+        # following the one with the "REFERAT" heading. Stream through
+        # the document and extract (and then throw away) each body
+        # paragraph as soon as it's been parsed, so that only the
+        # header and footer remain in the tree afterwards. This keeps
+        # memory usage down for very large referats.
+        body = []
+        seen_referat = False
+        referat_tr = body_tr = None
+        in_body = False
+        # Once a body paragraph containing a label is seen, it and
+        # all following paragraphs are kept, so that find_labels still
+        # finds labels (and the values after them) that only occur in
+        # the body.
+        keep = False
+        context = etree.iterparse(BytesIO(text), events=("start", "end"),
+                                  tag=(w_t, w_p, w_tr), recover=True)
+        for event, elem in context:
+            if event == "start":
+                if (elem.tag == w_tr and referat_tr is not None and
+                        body_tr is None and
+                        elem.getparent() is referat_tr.getparent()):
+                    body_tr = elem
+                    in_body = True
+            elif elem.tag == w_t:
+                if not seen_referat and elem.text and 'EFERAT' in elem.text:
+                    seen_referat = True
+                    referat_tr = next(elem.iterancestors(w_tr), None)
+            elif elem.tag == w_p:
+                if not in_body:
+                    continue
+                # paragraphs nested in other paragraphs (eg in text
+                # boxes) are handled together with their outermost
+                # paragraph, to keep them in document order
+                for ancestor in elem.iterancestors():
+                    if ancestor is body_tr or ancestor.tag == w_p:
+                        break
+                if ancestor.tag == w_p:
+                    continue
+                for p in elem.iter(w_p):
+                    body.append("".join([e.text or "" for e in p.iter(w_t)]))
+                if not keep:
+                    keep = any(self.is_label(t, label)
+                               for t in elem.itertext() if ":" in t
+                               for label in self.header_labels)
+                if not keep:
+                    elem.clear()
+            elif elem is body_tr:
+                in_body = False
+        root = context.root
+
         head = {}
         # Högst uppe på varje domslut står domstolsnamnet ("Högsta
         # domstolen") följt av referatnumret ("NJA 1987
         # s. 113").
-        firstfield = soup.find("w:t")
+        firstfield = root.find(".//w:t", ns)
         # Ibland är domstolsnamnet uppsplittat på två
         # w:r-element. Bäst att gå på all text i
         # föräldra-w:tc-cellen
-        firstfield = firstfield.find_parent("w:tc")
-        head['Domstol'] = firstfield.get_text(strip=True)
+        firstfield = firstfield.xpath("ancestor::w:tc[1]", namespaces=ns)[0]
+        head['Domstol'] = self.get_text(firstfield)
 
-        nextfield = firstfield.find_next("w:tc")
-        head['Referat'] = nextfield.get_text(strip=True)
+        nextfield = firstfield.xpath("following::w:tc[1]", namespaces=ns)[0]
+        head['Referat'] = self.get_text(nextfield)
+        labelnodes = self.find_labels(root, self.header_labels, 'EFERAT')
         # Hitta övriga enkla metadatafält i sidhuvudet
         for key in self.labels:
             if key in head:
                 continue
-            node = soup.find(text=re.compile(key + ':'))
-            if not node:
+            node = labelnodes.get(key)
+            if node is None:
                 # FIXME: should warn for missing Målnummer iff
                 # Domsnummer is not present, and vice versa. But at
                 # this point we don't have all fields
@@ -1055,54 +1393,48 @@ class DV(SwedishLegalSource):
                     self.log.warning("%s: Couldn't find field %r" % (basefile, key))
                 continue
 
-            txt = "".join([n.get_text() for n in node.find_next("w:t").find_parent("w:p").find_all("w:t", limit=2147483647)])
+            p = node.xpath("following::w:t[1]/ancestor::w:p[1]", namespaces=ns)[0]
+            txt = "".join([n.text or "" for n in p.iter(w_t)])
             if txt.strip():  # skippa fält med tomma strängen-värden (eller bara whitespace)
                 head[key] = txt
 
         # Hitta sammansatta metadata i sidhuvudet
         for key in ["Lagrum", "Rättsfall"]:
-            node = soup.find(text=re.compile(key + ':'))
-            if node:
-                textnodes = node.find_parent('w:tc').find_next_sibling('w:tc')
+            node = labelnodes.get(key)
+            if node is not None:
+                textnodes = node.xpath("ancestor::w:tc[1]/following-sibling::w:tc[1]",
+                                       namespaces=ns)
                 if not textnodes:
                     continue
                 items = []
-                for textnode in textnodes.find_all('w:t', limit=2147483647):
-                    t = textnode.get_text(strip=True)
+                for textnode in textnodes[0].iter(w_t):
+                    t = self.get_text(textnode)
                     if t:
                         items.append(t)
                 if items:
                     head[key] = items
 
-        # The main text body of the verdict
-        body = []
-        for p in soup.find(text=re.compile('EFERAT')).find_parent(
-                'w:tr').find_next_sibling('w:tr').find_all('w:p', limit=2147483647):
-            ptext = ''
-            for e in p.find_all("w:t", limit=2147483647):
-                ptext += e.string
-            body.append(ptext)
-
         # Finally, some more metadata in the footer
-        if soup.find(text=re.compile(r'Sökord:')):
-            head['Sökord'] = soup.find(
-                text=re.compile(r'Sökord:')).find_next('w:t').get_text(strip=True)
-
-        if soup.find(text=re.compile('^\s*Litteratur:\s*$')):
-            n = soup.find(text=re.compile('^\s*Litteratur:\s*$'))
-            head['Litteratur'] = n.findNext('w:t').get_text(strip=True)
+        for key in ["Sökord", "Litteratur"]:
+            node = labelnodes.get(key)
+            if node is not None:
+                head[key] = self.get_text(
+                    node.xpath("following::w:t[1]", namespaces=ns)[0])
         return head, body
 
+    # the table cell following the one containing a (label) node
+    next_entry = etree.XPath("ancestor-or-self::entry[1]/following-sibling::entry[1]")
+
     def parse_antiword_docbook(self, text, basefile):
-        soup = BeautifulSoup(text, "lxml")
+        root = self.parse_xml(text)
         head = {}
-        header_elements = soup.find("para")
-        header_text = ''
-        for el in header_elements.contents:
-            if hasattr(el, 'name') and el.name == "informaltable":
+        header_elements = root.find(".//para")
+        header_text = header_elements.text or ''
+        for el in header_elements:
+            if el.tag == "informaltable":
                 break
             else:
-                header_text += el.string
+                header_text += "".join(el.itertext()) + (el.tail or '')
 
         # Högst uppe på varje domslut står domstolsnamnet ("Högsta
         # domstolen") följt av referatnumret ("NJA 1987
@@ -1116,59 +1448,84 @@ class DV(SwedishLegalSource):
             head['Referat'] = parts[1]
         else:
             # alternativ står de på första raden i en informaltable
-            row = soup.find("informaltable").tgroup.tbody.row.find_all('entry')
-            head['Domstol'] = row[0].get_text(strip=True)
-            head['Referat'] = row[1].get_text(strip=True)
+            row = root.find(".//informaltable").find(".//tgroup").find(
+                ".//tbody").find(".//row").findall(".//entry")
+            head['Domstol'] = self.get_text(row[0])
+            head['Referat'] = self.get_text(row[1])
 
+        labelnodes = self.find_labels(root, self.header_labels, 'REFERAT')
         # Hitta övriga enkla metadatafält i sidhuvudet
         for key in self.labels:
-            node = soup.find(text=re.compile(key + ':'))
-            if node:
-                txt = node.find_parent('entry').find_next_sibling(
-                    'entry').get_text(strip=True)
+            node = labelnodes.get(key)
+            if node is not None:
+                txt = self.get_text(self.next_entry(node)[0])
                 if txt:
                     head[key] = txt
 
         # Hitta sammansatta metadata i sidhuvudet
         for key in ["Lagrum", "Rättsfall"]:
-            node = soup.find(text=re.compile(key + ':'))
-            if node:
+            node = labelnodes.get(key)
+            if node is not None:
                 head[key] = []
-                textchunk = node.find_parent(
-                    'entry').find_next_sibling('entry').string
+                textchunk = "".join(self.next_entry(node)[0].itertext())
                 for line in [util.normalize_space(x) for x in textchunk.split("\n\n")]:
                     if line:
                         head[key].append(line)
 
         body = []
-        for p in soup.find(text=re.compile('REFERAT')).find_parent('tgroup').find_next_sibling(
-                'tgroup').find('entry').get_text(strip=True).split("\n\n"):
+        for p in self.get_text(labelnodes['REFERAT'].xpath(
+                "ancestor-or-self::tgroup[1]/following-sibling::tgroup[1]//entry")[0]).split("\n\n"):
             body.append(p)
 
         # Hitta sammansatta metadata i sidfoten
-        head['Sökord'] = soup.find(text=re.compile('Sökord:')).find_parent(
-            'entry').next_sibling.next_sibling.get_text(strip=True)
+        head['Sökord'] = self.get_text(self.next_entry(labelnodes['Sökord'])[0])
 
-        if soup.find(text=re.compile('^\s*Litteratur:\s*$')):
-            n = soup.find(text=re.compile('^\s*Litteratur:\s*$')).find_parent(
-                'entry').next_sibling.next_sibling.get_text(strip=True)
-            head['Litteratur'] = n
+        node = labelnodes.get('Litteratur')
+        if node is not None:
+            head['Litteratur'] = self.get_text(self.next_entry(node)[0])
         return head, body
 
+    # patterns used by sanitize_metadata
+    re_nja_referat = re.compile(
+        r"NJA ?(\d+) ?s\.? ?(\d+) *\( ?(?:NJA|) ?[ :]?(\d+) ?: ?(\d+)")
+    re_referat = re.compile(
+        r"(?P<type>[A-ZÅÄÖ]+)[^\d]*(?P<year>\d+)[^\d]+(?P<ordinal>\d+)")
+    # maps the non-whitespace Målnummer delimiters to spaces, for use
+    # with str.translate
+    malnr_delimiters = {ord(","): " ", ord(";"): " "}
+    re_hovratt = re.compile(r"Hovrätten(för|över)")
+    referat_templ = {'ADO': 'AD %(year)s nr %(ordinal)s',
+                     'AD': '%(type)s %(year)s nr %(ordinal)s',
+                     'MDO': 'MD %(year)s:%(ordinal)s',
+                     'NJA': '%(type)s %(year)s s. %(ordinal)s',
+                     None: '%(type)s %(year)s:%(ordinal)s'
+                     }
+
+    @cached_property
+    def resource_lookups(self):
+        # cache for _lookup_resource
+        return {}
+
+    def _lookup_resource(self, label, predicate, cutoff):
+        # commondata doesn't change, and the same handful of court
+        # and publisher names are looked up for every document, so
+        # remember the matches (and failed lookups, as None).
+        # lookup_resource still logs the warning for a fuzzy match
+        # every time it's returned.
+        key = (label, predicate, cutoff)
+        if key not in self.resource_lookups:
+            try:
+                self.resource_lookups[key] = super(DV, self)._lookup_resource(
+                    label, predicate, cutoff)
+            except KeyError:
+                self.resource_lookups[key] = None
+        if self.resource_lookups[key] is None:
+            raise KeyError("No good match for '%s'" % label)
+        return self.resource_lookups[key]
+
     # correct broken/missing metadata
     def sanitize_metadata(self, head, basefile):
-        basefile_regex = re.compile('(?P<type>\w+)/(?P<year>\d+)-(?P<ordinal>\d+)')
-        nja_regex = re.compile(
-            "NJA ?(\d+) ?s\.? ?(\d+) *\( ?(?:NJA|) ?[ :]?(\d+) ?: ?(\d+)")
-        date_regex = re.compile("(\d+)[^\d]+(\d+)[^\d]+(\d+)")
-        referat_regex = re.compile(
-            "(?P<type>[A-ZÅÄÖ]+)[^\d]*(?P<year>\d+)[^\d]+(?P<ordinal>\d+)")
-        referat_templ = {'ADO': 'AD %(year)s nr %(ordinal)s',
-                         'AD': '%(type)s %(year)s nr %(ordinal)s',
-                         'MDO': 'MD %(year)s:%(ordinal)s',
-                         'NJA': '%(type)s %(year)s s. %(ordinal)s',
-                         None: '%(type)s %(year)s:%(ordinal)s'
-                         }
+        referat_templ = self.referat_templ
         # 0. strip whitespace
         for k, v in head.items():
             if isinstance(v, str):
@@ -1178,13 +1535,12 @@ class DV(SwedishLegalSource):
         if not head.get("Referat"):
             # For some courts (MDO, ADO) it's possible to reconstruct a missing
             # Referat from the basefile
-            m = basefile_regex.match(basefile)
-            if m and m.group("type") in ('ADO', 'MDO'):
-                head["Referat"] = referat_templ[m.group("type")] % (m.groupdict())
+            parts = self.basefile_parts(basefile)
+            if parts.get("type") in ('ADO', 'MDO'):
+                head["Referat"] = referat_templ[parts["type"]] % parts
 
         # 2. Correct known problems with Domstol not always being correctly specified
-        if "Hovrättenför" in head["Domstol"] or "Hovrättenöver" in head["Domstol"]:
-            head["Domstol"] = head["Domstol"].replace("Hovrätten", "Hovrätten ")
+        head["Domstol"] = self.re_hovratt.sub(r"Hovrätten \1", head["Domstol"])
         try:
             # if this throws a KeyError, it's not canonically specified
             self.lookup_resource(head["Domstol"], cutoff=1)
@@ -1202,11 +1558,8 @@ class DV(SwedishLegalSource):
             if head["Målnummer"][:2] in ('Ö ', 'B ', 'T '):
                 head["Målnummer"] = [head["Målnummer"].replace(" ", "")]
             else:
-                res = []
-                for v in re.split("och|,|;|\s", head['Målnummer']):
-                    if v.strip():
-                        res.append(v.strip())
-                head['Målnummer'] = res
+                head['Målnummer'] = head['Målnummer'].replace(
+                    "och", " ").translate(self.malnr_delimiters).split()
 
         # 4. Create a general term for Målnummer or Domsnummer to act
         # as a local identifier
@@ -1226,7 +1579,7 @@ class DV(SwedishLegalSource):
         # "NJA 2011 s. 638(NJA2011:57)" => ("NJA 2011 s 638", "NJA 2001:57")
         # "NJA 2012 s. 16(2012:2)" => ("NJA 2012 s 16", "NJA 2012:2")
         if "NJA" in head["Referat"] and " not " not in head["Referat"]:
-            m = nja_regex.match(head["Referat"])
+            m = self.re_nja_referat.match(head["Referat"])
             if m:
                 head["Referat"] = "NJA %s s %s" % (m.group(1), m.group(2))
                 head["_nja_ordinal"] = "NJA %s:%s" % (m.group(3), m.group(4))
@@ -1238,16 +1591,14 @@ class DV(SwedishLegalSource):
         # :180", "MD:2012:5", "MIG2011:14", "-MÖD 2010:32" and many
         # MANY more
         if " not " not in head["Referat"]:  # notiser always have OK Referat
-            m = referat_regex.search(head["Referat"])
+            m = self.re_referat.search(head["Referat"])
             if m:
-                if m.group("type") in referat_templ:
-                    head["Referat"] = referat_templ[m.group("type")] % m.groupdict()
-                else:
-                    head["Referat"] = referat_templ[None] % m.groupdict()
+                head["Referat"] = referat_templ.get(m.group("type"),
+                                                    referat_templ[None]) % m.groupdict()
             elif basefile.split("/")[0] in ('ADO', 'MDO'):
                 # FIXME: The same logic as under 1, duplicated
-                m = basefile_regex.match(basefile)
-                head["Referat"] = referat_templ[m.group("type")] % (m.groupdict())
+                parts = self.basefile_parts(basefile)
+                head["Referat"] = referat_templ[parts["type"]] % parts
             else:
                 raise errors.ParseError("Unparseable ref '%s'" % head["Referat"])
 
@@ -1271,14 +1622,20 @@ class DV(SwedishLegalSource):
         # 9. Done!
         return head
 
+    re_nonword_prefix = re.compile(r"^\W+")
+    re_sokord_subkeyword = re.compile(
+        r"(Allmän handling|Allmän försäkring|Arbetsskadeförsäkring|Besvärsrätt|Byggnadsmål|"
+        r"Plan- och bygglagen|Förhandsbesked|Resning)[:,?]?\s+\(?(.*?)\)?$")
     # Strings that might look like descriptions but actually are legit
     # keywords (albeit very wordy keywords)
     sokord_whitelist = ("Rättsprövning enligt lagen (2006:304) om rättsprövning av vissa regeringsbeslut",)
     def sanitize_sokord(self, sokordstring, basefile):
         def capitalize(s):
             # remove any non-word char start (like "- ", which
-            # sometimes occur due to double-dashes)
-            s = re.sub("^\W+", "", s)
+            # sometimes occur due to double-dashes). Almost all
+            # keywords start with a word char, so check that first.
+            if not (s[:1].isalnum() or s[:1] == "_"):
+                s = self.re_nonword_prefix.sub("", s)
             return util.ucfirst(s)
 
         def probable_description(s):
@@ -1303,7 +1660,7 @@ class DV(SwedishLegalSource):
             # (brev till biskop i pastoral angelägenhet)" or "Allmän
             # handling -övriga frågor?"
             if " - " not in s:
-                s = re.sub("(Allmän handling|Allmän försäkring|Arbetsskadeförsäkring|Besvärsrätt|Byggnadsmål|Plan- och bygglagen|Förhandsbesked|Resning)[:,?]?\s+\(?(.*?)\)?$", r"\1 - \2", s)
+                s = self.re_sokord_subkeyword.sub(r"\1 - \2", s)
             subres = []
             substrings = s.split(" - ") 
             for idx, subs in enumerate(substrings):
@@ -1323,6 +1680,8 @@ class DV(SwedishLegalSource):
             # might be a useful title. Communicate it back to the
             # caller (but if we have several, omit shorter substrings
             # of longer descs)
+            # (NB: each desc is only compared to the next longer one,
+            # so this is a single linear pass)
             descs.sort(key=len)
             descs = [desc for idx, desc in enumerate(descs) if (idx + 1) == len(descs) or desc not in descs[idx+1]]
             raise KeywordContainsDescription(res, descs)
@@ -1347,6 +1706,14 @@ class DV(SwedishLegalSource):
                                        self.minter,
                                        self.commondata)
 
+    # patterns used by polish_metadata
+    re_lopnummer = re.compile(r'\d{4}(?:\:| nr | not )(\d+)')
+    # the parts of a Referat, as (rpubl predicate, pattern) pairs
+    referat_parts = (('rattsfallspublikation', re.compile(r'([^ ]+)')),
+                     ('arsutgava', re.compile(r'(\d{4})')),
+                     ('lopnummer', re_lopnummer),
+                     ('sidnummer', re.compile(r's.? ?(\d+)')))
+
     # create nice RDF from the sanitized metadata
     def polish_metadata(self, head, basefile, infer_nodes=True):
 
@@ -1362,24 +1729,30 @@ class DV(SwedishLegalSource):
         graph = self.make_graph()
         refuri = ref_to_uri(head["Referat"])
         refdesc = Describer(graph, refuri)
+        publisher = self.lookup_resource(head["Domstol"])
+        # a scratch graph for minting the dom uri(s), reused (and
+        # cleaned out) for every målnummer
+        gtmp = Graph()
+        gtmp.bind("rpubl", RPUBL)
+        gtmp.bind("dcterms", DCTERMS)
         for malnummer in head['_localid']:
             bnodetmp = BNode()
-            gtmp = Graph()
-            gtmp.bind("rpubl", RPUBL)
-            gtmp.bind("dcterms", DCTERMS)
-            
             dtmp = Describer(gtmp, bnodetmp)
             dtmp.rdftype(RPUBL.VagledandeDomstolsavgorande)
             dtmp.value(RPUBL.malnummer, malnummer)
             dtmp.value(RPUBL.avgorandedatum, head['Avgörandedatum'])
-            dtmp.rel(DCTERMS.publisher, self.lookup_resource(head["Domstol"]))
-            resource = dtmp.graph.resource(bnodetmp)
+            dtmp.rel(DCTERMS.publisher, publisher)
+            resource = gtmp.resource(bnodetmp)
             domuri = self.minter.space.coin_uri(resource)
+            gtmp.remove((bnodetmp, None, None))
             domdesc = Describer(graph, domuri)
             
         # 2. convert all strings in head to proper RDF (well, some is
-        # converted to mixed-content lists and stored in self._bodymeta
-        self._bodymeta = defaultdict(list)
+        # converted to mixed-content lists and stored in self._bodymeta,
+        # in the order that postprocess_doc should output them)
+        self._bodymeta = OrderedDict([("Lagrum", []),
+                                      ("Litteratur", []),
+                                      ("Rättsfall", [])])
         for label, value in head.items():
             if label == "Rubrik":
                 value = util.normalize_space(value)
@@ -1408,11 +1781,8 @@ class DV(SwedishLegalSource):
             elif label == "Avdelning":
                 domdesc.value(RPUBL.avdelning, value)
             elif label == "Referat":
-                for pred, regex in {'rattsfallspublikation': r'([^ ]+)',
-                                    'arsutgava': r'(\d{4})',
-                                    'lopnummer': r'\d{4}(?:\:| nr | not )(\d+)',
-                                    'sidnummer': r's.? ?(\d+)'}.items():
-                    m = re.search(regex, value)
+                for pred, regex in self.referat_parts:
+                    m = regex.search(value)
                     if m:
                         if pred == 'rattsfallspublikation':
                             uri = self.lookup_resource(m.group(1),
@@ -1426,7 +1796,7 @@ class DV(SwedishLegalSource):
             elif label == "_nja_ordinal":
                 refdesc.value(DCTERMS.bibliographicCitation,
                               value)
-                m = re.search(r'\d{4}(?:\:| nr | not )(\d+)', value)
+                m = self.re_lopnummer.search(value)
                 if m:
                     refdesc.value(RPUBL.lopnummer, m.group(1))
             elif label == "Avgörandedatum":
@@ -1442,23 +1812,22 @@ class DV(SwedishLegalSource):
             # is so that we can represent mixed content metadata
             # (links, linktexts and unlinked text)
             elif label == "Lagrum":
-                for i in value:  # better be list not string
+                # value better be list not string
+#                for i in value:
 #                    if (re.search("\d+/\d+/(EU|EG|EEG)", i) or
 #                        re.search("\((EU|EG|EEG)\) nr \d+/\d+", i) or
 #                        " direktiv" in i or " förordning" in i):
 #                        self.log.warning("%s(%s): Lagrum ref to EULaw: '%s'" %
 #                                         (head.get("Referat"), head.get("Målnummer"), i))
-                    self._bodymeta[label].append(self.lagrum_parser.parse_string(i,
-                                                 predicate="rpubl:lagrum"))
+                self._bodymeta[label].extend(self.lagrum_parser.parse_strings(value,
+                                             predicate="rpubl:lagrum"))
             elif label == "Rättsfall":
-                for i in value:
-                    self._bodymeta[label].append(self.rattsfall_parser.parse_string(i,
-                                                 predicate="rpubl:rattsfallshanvisning"))
+                self._bodymeta[label].extend(self.rattsfall_parser.parse_strings(value,
+                                             predicate="rpubl:rattsfallshanvisning"))
             elif label == "Litteratur":
                 if value:
-                    for i in value.split(";"):
-                        self._bodymeta[label].append(self.litteratur_parser.parse_string(i,
-                                                     predicate="dcterms:relation"))
+                    self._bodymeta[label].extend(self.litteratur_parser.parse_strings(value.split(";"),
+                                                 predicate="dcterms:relation"))
             elif label == "Sökord":
                 for s in value:
                     self.add_keyword_to_metadata(domdesc, s)
@@ -1487,16 +1856,68 @@ class DV(SwedishLegalSource):
         # Subclasses that has an idea of how to create a URI for a
         # keyword/concept might override this. 
         assert isinstance(keyword, tuple), "Keyword %s should have been a tuple of sub-keywords (possible 1-tuple)"
-        with domdesc.rel(DCTERMS.subject):
-            # if subkeywords, create a label like "Allmän handling»Begärd handling saknades"
-            domdesc.value(RDFS.label, "»".join(keyword), lang=self.lang)
+        # some documents have lots of keywords, so don't use rel() as
+        # a context manager (or value()) for the label -- add it
+        # directly to the graph. Called without a with block, rel()
+        # just adds the dcterms:subject triple.
+        node = BNode()
+        domdesc.rel(DCTERMS.subject, node)
+        # if subkeywords, create a label like "Allmän handling»Begärd handling saknades"
+        domdesc.graph.add((node, RDFS.label, Literal("»".join(keyword), lang=self.lang)))
+
+    # The mapfile that postprocess_doc appends to, see
+    # _open_mapfile. There's at most one per process, so it's kept on
+    # the class where the parse_all_teardown classmethod can close it
+    # once the batch is done.
+    _mapfile_fp = None
+    _mapfile_atexit = False
+
+    @staticmethod
+    def _close_mapfile():
+        if DV._mapfile_fp is not None:
+            DV._mapfile_fp.close()
+            DV._mapfile_fp = None
+
+    def _open_mapfile(self, mapfile):
+        # Keep the mapfile open for appending between documents,
+        # unless it has been replaced (eg by relate_all_setup) since
+        # it was opened.
+        fp = DV._mapfile_fp
+        if fp is not None:
+            try:
+                if (fp.name == mapfile and
+                        os.path.samestat(os.fstat(fp.fileno()),
+                                         os.stat(mapfile))):
+                    return fp
+            except (OSError, ValueError):
+                pass
+            fp.close()
+        if not DV._mapfile_atexit:
+            # parse_all_teardown isn't run when parsing a single
+            # document
+            atexit.register(DV._close_mapfile)
+            DV._mapfile_atexit = True
+        DV._mapfile_fp = codecs.open(mapfile, "a", encoding="utf-8")
+        return DV._mapfile_fp
+
+    @classmethod
+    def parse_all_teardown(cls, config, *args, **kwargs):
+        cls._close_mapfile()
+        return super(DV, cls).parse_all_teardown(config, *args, **kwargs)
+
+    @cached_property
+    def _uri_tail_idx(self):
+        # length of eg "https://lagen.nu/dom/", which postprocess_doc
+        # chops off the URI of every document
+        return len(self.urispace_base) + len(self.urispace_segment) + 2
 
     def postprocess_doc(self, doc):
         if self.config.mapfiletype == "nginx":
-            path = urlparse(doc.uri).path
+            # same as urlparse(doc.uri).path, for URIs without query
+            # or fragment
+            path = "/" + doc.uri.split("://", 1)[-1].split("/", 1)[-1]
         else:
-            idx = len(self.urispace_base) + len(self.urispace_segment) + 2
-            path = doc.uri[idx:]
+            path = doc.uri[self._uri_tail_idx:]
 
         def map_append_needed(mapped_path, filename):
             if mapped_path == path:
@@ -1531,14 +1952,23 @@ class DV(SwedishLegalSource):
                 mapfile = self.store.path("uri", "generated", ".%s.%s.map" % (self.config.clientname, os.getpid()))
             else:
                 mapfile = self.store.path("uri", "generated", ".map")
-            with codecs.open(mapfile, "a", encoding="utf-8") as fp:
+            fp = self._open_mapfile(mapfile)
+            if self.config.mapfiletype == "nginx":
+                fp.write("%s\t/dv/generated/%s.html;\n" % (path,
+                                                           doc.basefile))
+            else:
+                fp.write("%s\t%s\n" % (path, doc.basefile))
+            # readmapfile (in this and other processes) must see the
+            # new line when the next document is postprocessed
+            fp.flush()
+            if 'basefilemap' in self.__dict__:
+                # add the new entry the same way basefilemap would
+                # have read it from the mapfile
                 if self.config.mapfiletype == "nginx":
-                    fp.write("%s\t/dv/generated/%s.html;\n" % (path,
-                                                               doc.basefile))
+                    key = path[len(self.urispace_segment) + 2:]
                 else:
-                    fp.write("%s\t%s\n" % (path, doc.basefile))
-            if hasattr(self, "_basefilemap"):
-                delattr(self, "_basefilemap")
+                    key = path
+                self.basefilemap[key] = doc.basefile
 
         # NB: This cannot be made to work 100% as there is not a 1:1
         # mapping between basefiles and URIs since multiple basefiles
@@ -1564,15 +1994,15 @@ class DV(SwedishLegalSource):
             roots.append(doc.body)
 
         for root in roots:
-            for node in list(root):
-                if isinstance(node, Instans) and len(node) == 0:
-                    # print("Removing Instans %r" % node.court)
-                    root.remove(node)
+            root[:] = [node for node in root
+                       if not (isinstance(node, Instans) and len(node) == 0)]
 
         # add information from _bodymeta to doc.body
         bodymeta = Div(**{'class': 'bodymeta',
                           'about': str(doc.meta.value(URIRef(doc.uri), RPUBL.referatAvDomstolsavgorande))})
-        for k, v in sorted(self._bodymeta.items()):
+        for k, v in self._bodymeta.items():
+            if not v:
+                continue
             d = Div(**{'class': k})
             for i in v:
                 d.append(P(i))
@@ -1586,246 +2016,379 @@ class DV(SwedishLegalSource):
         if not os.path.exists(p):
             raise ValueError("No distilled file for basefile %s at %s" % (basefile, p))
 
+        uri = self.canonical_uri(basefile)
+        # The distilled file is pretty-xml serialized RDF/XML, where
+        # the referat/notis is a typed node element with its
+        # identifier as a plain child element. Scanning for the node
+        # about uri is much cheaper than building a second Graph
+        # (canonical_uri has already built one).
+        rdf_about = "{%s}about" % util.ns['rdf']
+        dcterms_identifier = "{%s}identifier" % util.ns['dcterms']
+        nodetags = ("{%s}Rattsfallsreferat" % RPUBL,
+                    "{%s}Rattsfallsnotis" % RPUBL)
+        with self.store.open_distilled(basefile, "rb") as fp:
+            for event, elem in etree.iterparse(fp, tag=nodetags):
+                if elem.get(rdf_about) == uri:
+                    ident = elem.find(dcterms_identifier)
+                    if ident is not None and ident.text:
+                        return ident.text
+                    break
+        # fall back to reading the complete graph
         with self.store.open_distilled(basefile) as fp:
             g = Graph().parse(data=fp.read())
-        uri = self.canonical_uri(basefile)
         return str(g.value(URIRef(uri), DCTERMS.identifier))
         
     def parse_body_parseconfigs(self):
         return ("default", "simple")
 
     # @staticmethod
-    def get_parser(self, basefile, sanitized, parseconfig="default"):
-        re_courtname = re.compile(
-            "^(Högsta domstolen|Hovrätten (över|för)[A-ZÅÄÖa-zåäö ]+|([A-ZÅÄÖ][a-zåäö]+ )(tingsrätt|hovrätt))(|, mark- och miljödomstolen|, Mark- och miljööverdomstolen)$")
+    # patterns used by get_parser to recognize the start of instans,
+    # dom, domskal and domslut sections. A pattern with a 'court' key
+    # is only used for basefiles from those courts.
+    parser_patterns = (
+        {'name': 'fr-överkl',
+         're': '(?P<karanden>[\w\.\(\)\- ]+) överklagade (beslutet|domen) '
+               'till (?P<court>(Förvaltningsrätten|Länsrätten|Kammarrätten) i \w+(| län)'
+               '(|, migrationsdomstolen|, Migrationsöverdomstolen)|'
+               'Högsta förvaltningsdomstolen)( \((?P<date>\d+-\d+-\d+), '
+               '(?P<constitution>[\w\.\- ,]+)\)|$)',
+         'method': 'match',
+         'type': ('instans',),
+         'court': ('REG', 'HFD', 'MIG')},
+
+        {'name': 'fr-dom',
+         're': '(?P<court>(Förvaltningsrätten|'
+               'Länsrätten|Kammarrätten) i \w+(| län)'
+               '(|, migrationsdomstolen|, Migrationsöverdomstolen)|'
+               'Högsta förvaltningsdomstolen) \((?P<date>\d+-\d+-\d+), '
+               '(?P<constitution>[\w\.\- ,]+)\)',
+         'method': 'match',
+         'type': ('dom',),
+         'court': ('REG', 'HFD', 'MIG')},
+
+        {'name': 'tr-dom',
+         're': '(?P<court>TR:n|Tingsrätten|HovR:n|Hovrätten|Mark- och miljödomstolen) \((?P<constitution>[\w\.\- ,]+)\) (anförde|fastställde|stadfäste|meddelade) (följande i |i beslut i |i |)(dom|beslut) (d\.|d|den) (?P<date>\d+ \w+\.? \d+)',
+         'method': 'match',
+         'type': ('dom',),
+         'court': ('HDO', 'HGO', 'HNN', 'HON', 'HSB', 'HSV', 'HVS')},
+        {'name': 'hd-dom',
+         're': 'Målet avgjordes efter huvudförhandling (av|i) (?P<court>HD) \((?P<constitution>[\w:\.\- ,]+)\),? som',
+         'method': 'match',
+         'type': ('dom',),
+         'court': ('HDO',)},
+        {'name': 'hd-dom2',
+         're': '(?P<court>HD) \((?P<constitution>[\w:\.\- ,]+)\) meddelade den (?P<date>\d+ \w+ \d+) följande',
+         'method': 'match',
+         'type': ('dom',),
+         'court': ('HDO',)},
+        {'name': 'hd-fastst',
+         're': '(?P<court>HD) \((?P<constitution>[\w:\.\- ,]+)\) (beslöt|fattade (slutligt|följande slutliga) beslut)',
+         'method': 'match',
+         'type': ('dom',),
+         'court': ('HDO',)},
+
+        {'name': 'mig-dom',
+         're': '(?P<court>Kammarrätten i Stockholm, Migrationsöverdomstolen)  \((?P<date>\d+-\d+-\d+), (?P<constitution>[\w\.\- ,]+)\)',
+         'method': 'match',
+         'type': ('dom',),
+         'court': ('MIG',)},
+        {'name': 'miv-forstainstans',
+         're': '(?P<court>Migrationsverket) avslog (ansökan|ansökningarna) den (?P<date>\d+ \w+ \d+) och beslutade att',
+         'method': 'match',
+         'type': ('dom',),
+         'court': ('MIG',)},
+        {'name': 'miv-forstainstans-2',
+         're': '(?P<court>Migrationsverket) avslog den (?P<date>\d+ \w+ \d+) A:s ansökan och beslutade att',
+         'method': 'match',
+         'type': ('dom',),
+         'court': ('MIG',)},
+        {'name': 'mig-dom-alt',
+         're': 'I sin dom avslog (?P<court>Förvaltningsrätten i Stockholm, migrationsdomstolen) \((?P<date>\d+- ?\d+-\d+), (?P<constitution>[\w\.\- ,]+)\)',
+         'method': 'match',
+         'type': ('dom',),
+         'court': ('MIG',)},
+        {'name': 'allm-åkl',
+         're': 'Allmän åklagare yrkade (.*)vid (?P<court>(([A-ZÅÄÖ]'
+               '[a-zåäö]+ )+)(TR|tingsrätt))',
+         'method': 'match',
+         'type': ('instans',),
+         'court': ('HDO', 'HGO', 'HNN', 'HON', 'HSB', 'HSV', 'HVS')},
+        {'name': 'stämning',
+         're': 'stämning å (?P<svarande>.*) vid (?P<court>(([A-ZÅÄÖ]'
+               '[a-zåäö]+ )+)(TR|tingsrätt))',
+         'method': 'search',
+         'type': ('instans',),
+         'court': ('HDO', 'HGO', 'HNN', 'HON', 'HSB', 'HSV', 'HVS')},
+        {'name': 'ansökan',
+         're': 'ansökte vid (?P<court>(([A-ZÅÄÖ][a-zåäö]+ )+)'
+               '(TR|tingsrätt)) om ',
+         'method': 'search',
+         'type': ('instans',),
+         'court': ('HDO', 'HGO', 'HNN', 'HON', 'HSB', 'HSV', 'HVS')},
+        {'name': 'riksåkl',
+         're': 'Riksåklagaren väckte i (?P<court>HD|HovR:n (över|för) '
+               '([A-ZÅÄÖ][a-zåäö]+ )+|[A-ZÅÄÖ][a-zåäö]+ HovR) åtal',
+               'method': 'match',
+         'type': ('instans',),
+         'court': ('HDO', 'HGO', 'HNN', 'HON', 'HSB', 'HSV', 'HVS')},
+        {'name': 'tr-överkl',
+         're': '(?P<karande>[\w\.\(\)\- ]+) (fullföljde talan|'
+               'överklagade) (|TR:ns dom.*)i (?P<court>HD|(HovR:n|hovrätten) '
+               '(över|för) (Skåne och Blekinge|Västra Sverige|Nedre '
+               'Norrland|Övre Norrland)|(Svea|Göta) (HovR|hovrätt))',
+               'method': 'match',
+         'type': ('instans',),
+         'court': ('HDO', 'HGO', 'HNN', 'HON', 'HSB', 'HSV', 'HVS')},
+        {'name': 'fullfölj-överkl',
+         're': '(?P<karanden>[\w\.\(\)\- ]+) fullföljde sin talan$',
+         'method': 'match',
+         'type': ('instans',)},
+        {'name': 'myndighetsansökan',
+         're': 'I (ansökan|en ansökan|besvär) hos (?P<court>\w+) '
+               '(om förhandsbesked|yrkade)',
+         'method': 'match',
+         'type': ('instans',),
+         'court': ('REG', 'HFD')},
+        {'name': 'myndighetsbeslut',
+         're': '(?P<court>\w+) beslutade (därefter |)(den (?P<date>\d+ \w+ \d+)|'
+               '[\w ]+) att',
+         'method': 'match',
+         'type': ('instans',),
+         'court': ('REG', 'HFD', 'MIG')},
+        {'name': 'myndighetsbeslut2',
+         're': '(?P<court>[\w ]+) (bedömde|vägrade) i (bistånds|)beslut'
+               ' (|den (?P<date>\d+ \w+ \d+))',
+         'method': 'match',
+         'type': ('instans',),
+         'court': ('REG', 'HFD')},
+        {'name': 'hd-revision',
+         're': '(?P<karanden>[\w\.\(\)\- ]+) sökte revision och yrkade(,'
+               'i första hand,|, såsom hans talan fick förstås,|,|) att (?P<court>HD|)',
+         'method': 'match',
+         'type': ('instans',),
+         'court': ('HDO',)},
+        {'name': 'hd-revision2',
+         're': '(?P<karanden>[\w\.\(\)\- ]+) sökte revision$',
+         'method': 'match',
+         'type': ('instans',),
+         'court': 'HDO'},
+        {'name': 'hd-revision3',
+         're': '(?P<karanden>[\w\.\(\)\- ]+) sökte revision och framställde samma yrkanden',
+         'method': 'match',
+         'type': ('instans',),
+         'court': 'HDO'},
+        {'name': 'överklag-bifall',
+         're': '(?P<karanden>[\w\.\(\)\- ]+) (anförde besvär|'
+               'överklagade) och yrkade bifall till (sin talan i '
+               '(?P<prevcourt>HovR:n|TR:n)|)',
+         'method': 'match',
+         'type': ('instans',),
+         'court': ('HDO', 'HGO', 'HNN', 'HON', 'HSB', 'HSV', 'HVS')},
+        {'name': 'överklag-2',
+         're': '(?P<karanden>[\w\.\(\)\- ]+) överklagade '
+               '(för egen del |)och yrkade (i själva saken |)att '
+               '(?P<court>HD|HovR:n|kammarrätten|Regeringsrätten|)',
+         'method': 'match',
+         'type': ('instans',)},
+        {'name': 'överklag-3',
+         're': '(?P<karanden>[\w\.\(\)\- ]+) överklagade (?P<prevcourt>'
+               '\w+)s (beslut|omprövningsbeslut|dom)( i ersättningsfrågan|) (hos|till) '
+               '(?P<court>[\w\, ]+?)( och yrkade| och anförde|, som| \(Sverige\)|$)',
+         'method': 'match',
+         'type': ('instans',)},
+        {'name': 'överklag-4',
+         're': '(?!Även )(?P<karanden>(?!HD fastställer)[\w\.\(\)\- ]+) överklagade ((?P<prevcourt>\w+)s (beslut|dom)|beslutet|domen)( och|$)',
+         'method': 'match',
+         'type': ('instans',)},
+        {'name': 'hd-ansokan',
+         're': '(?P<karanden>[\w\.\(\)\- ]+) anhöll i ansökan som inkom '
+               'till (?P<court>HD) d \d+ \w+ \d+',
+         'method': 'match',
+         'type': ('instans',),
+         'court': ('HDO',)},
+        {'name': 'hd-skrivelse',
+         're': '(?P<karanden>[\w\.\(\)\- ]+) anförde i en till '
+               '(?P<court>HD) den \d+ \w+ \d+ ställd',
+         'method': 'match',
+         'type': ('instans',),
+         'court': ('HDO',)},
+        {'name': 'överklag-5',
+         're': '(?!Även )(?P<karanden>[\w\.\(\)\- ]+?) överklagade '
+               '(?P<prevcourt>\w+)s (dom|domar)',
+         'method': 'match',
+         'type': ('instans',)},
+        {'name': 'överklag-6',
+         're': '(?P<karanden>[\w\.\(\)\- ]+) överklagade domen till '
+               '(?P<court>\w+)($| och yrkade)',
+         'method': 'match',
+         'type': ('instans',)},
+        {'name': 'myndighetsbeslut3',
+         're': 'I sitt beslut den (?P<date>\d+ \w+ \d+) avslog '
+               '(?P<court>\w+)',
+         'method': 'match',
+         'type': ('instans',),
+         'court': ('REG', 'HFD', 'MIG')},
+        {'name': 'domskal',
+         're': "(Skäl|Domskäl|HovR:ns domskäl|Hovrättens domskäl)(\. |$)",
+         'method': 'match',
+         'type': ('domskal',)},
+        {'name': 'domskal-ref',
+         're': "(Tingsrätten|TR[:\.]n|Hovrätten|HD|Högsta förvaltningsdomstolen) \([^)]*\) (meddelade|anförde|fastställde|yttrade)",
+         'method': 'match',
+         'type': ('domskal',)},
+        {'name': 'domskal-dom-fr',  # a simplified copy of fr-överkl
+         're': '(?P<court>(Förvaltningsrätten|'
+               'Länsrätten|Kammarrätten) i \w+(| län)'
+               '(|, migrationsdomstolen|, Migrationsöverdomstolen)|'
+               'Högsta förvaltningsdomstolen) \((?P<date>\d+-\d+-\d+), '
+               '(?P<constitution>[\w\.\- ,]+)\),? yttrade',
+         'method': 'match',
+         'type': ('domskal',)},
+        {'name': 'domslut-standalone',
+         're': '(Domslut|(?P<court>Hovrätten|HD|hd|Högsta förvaltningsdomstolen):?s avgörande)$',
+         'method': 'match',
+         'type': ('domslut',)},
+        {'name': 'domslut-start',
+         're': '(?P<court>[\w ]+(domstolen|rätten))s avgörande$',
+         'method': 'match',
+         'type': ('domslut',)}
+    )
+
+    # the compiled patterns (as bound match/search methods), so that
+    # this is only done once and not for every parsed document
+    parser_matchers = tuple((getattr(re.compile(pat['re'], re.UNICODE), pat['method']), pat)
+                            for pat in parser_patterns)
+    # is_instans uses this particular pattern by itself
+    domskal_match = next(match for match, pat in parser_matchers if pat['name'] == 'domskal')
+
+    # the same few court names are canonicalized over and over again
+    # (see is_equivalent_court in get_parser)
+    @staticmethod
+    @lru_cache(maxsize=512)
+    def canonicalize_court(courtname):
+        if isinstance(courtname, bool):
+            return courtname  # we have no idea which court this
+            # is, only that it is A court
+        else:
+            return courtname.replace(
+                "HD", "Högsta domstolen").replace("HovR", "Hovrätt")
+
+    @cached_property
+    def court_matchers(self):
+        # maps a court (the first part of a basefile) to the matchers
+        # that get_parser uses for that court, grouped by type. Filled
+        # in by get_parser as needed.
+        return {}
+
+    re_groupname = re.compile(r"\(\?P<(\w+)>")
+
+    def make_matchers(self, matchers):
+        # Turns a list of (match method, pattern) pairs from
+        # parser_matchers into a list of functions that return a
+        # (name, groupdict) tuple for the pattern that matched (or
+        # None). The patterns are combined into a single alternation,
+        # which tries them in the same order but in a single
+        # call. Older versions of re can't handle more than 100
+        # groups in a pattern, so very long lists are split up.
+        result = []
+        run = []
+        rungroups = 0
+        for match, pat in matchers:
+            groups = match.__self__.groups + 1
+            if run and rungroups + groups >= 100:
+                result.append(self.make_alternation(run))
+                run = []
+                rungroups = 0
+            run.append((match, pat))
+            rungroups += groups
+        if run:
+            result.append(self.make_alternation(run))
+        return result
+
+    def make_alternation(self, matchers):
+        if len(matchers) == 1:
+            match, pat = matchers[0]
+            name = pat['name']
+
+            def matcher(s):
+                m = match(s)
+                if m:
+                    return name, m.groupdict()
+            return matcher
+
+        # each alternative is wrapped in a group named after its
+        # index, and the named groups within are made unique by
+        # suffixing them with the same index.
+        alternatives = []
+        groupnames = []
+        for idx, (match, pat) in enumerate(matchers):
+            names = []
+
+            def rename(m):
+                names.append(("%s_%s" % (m.group(1), idx), m.group(1)))
+                return "(?P<%s>" % names[-1][0]
+            # a lazy prefix makes the alternation find the leftmost
+            # match of a re.search pattern, just like search would
+            prefix = r"[\s\S]*?" if pat['method'] == 'search' else ""
+            alternatives.append("(?P<_%s>%s%s)" % (idx, prefix, self.re_groupname.sub(rename, pat['re'])))
+            groupnames.append((pat['name'], names))
+        match = re.compile("|".join(alternatives), re.UNICODE).match
+
+        def matcher(s):
+            m = match(s)
+            if m:
+                # the alternative's group is the outermost, and
+                # therefore the last one to close
+                name, names = groupnames[int(m.lastgroup[1:])]
+                return name, dict((orig, m.group(unique)) for (unique, orig) in names)
+        return matcher
+
+    # used by get_parser (analyze_instans)
+    re_courtname = re.compile(
+        "^(Högsta domstolen|Hovrätten (över|för)[A-ZÅÄÖa-zåäö ]+|([A-ZÅÄÖ][a-zåäö]+ )(tingsrätt|hovrätt))(|, mark- och miljödomstolen|, Mark- och miljööverdomstolen)$")
+
+    # used by get_parser (is_skiljaktig, is_tillagg, is_endmeta)
+    re_skiljaktig = re.compile(
+        r"(Justitie|Kammarrätts)råde[nt] ([^\.]*) var (skiljaktig|av skiljaktig mening)")
+    re_tillagg = re.compile(
+        r"Justitieråde[nt] ([^\.]*) (tillade för egen del|gjorde för egen del ett tillägg)")
+    re_endmeta = re.compile(r"HD:s (beslut|dom|domar) meddela(de|d|t): den")
+    # the above, as a single alternation (the name of the outermost
+    # group tells which one matched)
+    re_section = re.compile("(?P<skiljaktig>%s)|(?P<tillagg>%s)|(?P<endmeta>%s)" %
+                            (re_skiljaktig.pattern, re_tillagg.pattern,
+                             re_endmeta.pattern))
+
+    # used by get_parser (split_sentences, ordered, make_paragraph)
+    re_sentence_end = re.compile(r"(?<![A-ZÅÄÖ])\. (?=[A-ZÅÄÖ]|$)")
+    re_ordinal = re.compile(r"(\d+)\.?\s")
+    re_ordinal_prefix = re.compile(r"^\s*\d+\. ")
 
+    def get_parser(self, basefile, sanitized, parseconfig="default"):
 #         productions = {'karande': '..',
 #                        'court': '..',
 #                        'date': '..'}
 
-        # at parse time, initialize matchers
-        rx = (
-            {'name': 'fr-överkl',
-             're': '(?P<karanden>[\w\.\(\)\- ]+) överklagade (beslutet|domen) '
-                   'till (?P<court>(Förvaltningsrätten|Länsrätten|Kammarrätten) i \w+(| län)'
-                   '(|, migrationsdomstolen|, Migrationsöverdomstolen)|'
-                   'Högsta förvaltningsdomstolen)( \((?P<date>\d+-\d+-\d+), '
-                   '(?P<constitution>[\w\.\- ,]+)\)|$)',
-             'method': 'match',
-             'type': ('instans',),
-             'court': ('REG', 'HFD', 'MIG')},
-
-            {'name': 'fr-dom',
-             're': '(?P<court>(Förvaltningsrätten|'
-                   'Länsrätten|Kammarrätten) i \w+(| län)'
-                   '(|, migrationsdomstolen|, Migrationsöverdomstolen)|'
-                   'Högsta förvaltningsdomstolen) \((?P<date>\d+-\d+-\d+), '
-                   '(?P<constitution>[\w\.\- ,]+)\)',
-             'method': 'match',
-             'type': ('dom',),
-             'court': ('REG', 'HFD', 'MIG')},
-
-            {'name': 'tr-dom',
-             're': '(?P<court>TR:n|Tingsrätten|HovR:n|Hovrätten|Mark- och miljödomstolen) \((?P<constitution>[\w\.\- ,]+)\) (anförde|fastställde|stadfäste|meddelade) (följande i |i beslut i |i |)(dom|beslut) (d\.|d|den) (?P<date>\d+ \w+\.? \d+)',
-             'method': 'match',
-             'type': ('dom',),
-             'court': ('HDO', 'HGO', 'HNN', 'HON', 'HSB', 'HSV', 'HVS')},
-            {'name': 'hd-dom',
-             're': 'Målet avgjordes efter huvudförhandling (av|i) (?P<court>HD) \((?P<constitution>[\w:\.\- ,]+)\),? som',
-             'method': 'match',
-             'type': ('dom',),
-             'court': ('HDO',)},
-            {'name': 'hd-dom2',
-             're': '(?P<court>HD) \((?P<constitution>[\w:\.\- ,]+)\) meddelade den (?P<date>\d+ \w+ \d+) följande',
-             'method': 'match',
-             'type': ('dom',),
-             'court': ('HDO',)},
-            {'name': 'hd-fastst',
-             're': '(?P<court>HD) \((?P<constitution>[\w:\.\- ,]+)\) (beslöt|fattade (slutligt|följande slutliga) beslut)',
-             'method': 'match',
-             'type': ('dom',),
-             'court': ('HDO',)},
-
-            {'name': 'mig-dom',
-             're': '(?P<court>Kammarrätten i Stockholm, Migrationsöverdomstolen)  \((?P<date>\d+-\d+-\d+), (?P<constitution>[\w\.\- ,]+)\)',
-             'method': 'match',
-             'type': ('dom',),
-             'court': ('MIG',)},
-            {'name': 'miv-forstainstans',
-             're': '(?P<court>Migrationsverket) avslog (ansökan|ansökningarna) den (?P<date>\d+ \w+ \d+) och beslutade att',
-             'method': 'match',
-             'type': ('dom',),
-             'court': ('MIG',)},
-            {'name': 'miv-forstainstans-2',
-             're': '(?P<court>Migrationsverket) avslog den (?P<date>\d+ \w+ \d+) A:s ansökan och beslutade att',
-             'method': 'match',
-             'type': ('dom',),
-             'court': ('MIG',)},
-            {'name': 'mig-dom-alt',
-             're': 'I sin dom avslog (?P<court>Förvaltningsrätten i Stockholm, migrationsdomstolen) \((?P<date>\d+- ?\d+-\d+), (?P<constitution>[\w\.\- ,]+)\)',
-             'method': 'match',
-             'type': ('dom',),
-             'court': ('MIG',)},
-            {'name': 'allm-åkl',
-             're': 'Allmän åklagare yrkade (.*)vid (?P<court>(([A-ZÅÄÖ]'
-                   '[a-zåäö]+ )+)(TR|tingsrätt))',
-             'method': 'match',
-             'type': ('instans',),
-             'court': ('HDO', 'HGO', 'HNN', 'HON', 'HSB', 'HSV', 'HVS')},
-            {'name': 'stämning',
-             're': 'stämning å (?P<svarande>.*) vid (?P<court>(([A-ZÅÄÖ]'
-                   '[a-zåäö]+ )+)(TR|tingsrätt))',
-             'method': 'search',
-             'type': ('instans',),
-             'court': ('HDO', 'HGO', 'HNN', 'HON', 'HSB', 'HSV', 'HVS')},
-            {'name': 'ansökan',
-             're': 'ansökte vid (?P<court>(([A-ZÅÄÖ][a-zåäö]+ )+)'
-                   '(TR|tingsrätt)) om ',
-             'method': 'search',
-             'type': ('instans',),
-             'court': ('HDO', 'HGO', 'HNN', 'HON', 'HSB', 'HSV', 'HVS')},
-            {'name': 'riksåkl',
-             're': 'Riksåklagaren väckte i (?P<court>HD|HovR:n (över|för) '
-                   '([A-ZÅÄÖ][a-zåäö]+ )+|[A-ZÅÄÖ][a-zåäö]+ HovR) åtal',
-                   'method': 'match',
-             'type': ('instans',),
-             'court': ('HDO', 'HGO', 'HNN', 'HON', 'HSB', 'HSV', 'HVS')},
-            {'name': 'tr-överkl',
-             're': '(?P<karande>[\w\.\(\)\- ]+) (fullföljde talan|'
-                   'överklagade) (|TR:ns dom.*)i (?P<court>HD|(HovR:n|hovrätten) '
-                   '(över|för) (Skåne och Blekinge|Västra Sverige|Nedre '
-                   'Norrland|Övre Norrland)|(Svea|Göta) (HovR|hovrätt))',
-                   'method': 'match',
-             'type': ('instans',),
-             'court': ('HDO', 'HGO', 'HNN', 'HON', 'HSB', 'HSV', 'HVS')},
-            {'name': 'fullfölj-överkl',
-             're': '(?P<karanden>[\w\.\(\)\- ]+) fullföljde sin talan$',
-             'method': 'match',
-             'type': ('instans',)},
-            {'name': 'myndighetsansökan',
-             're': 'I (ansökan|en ansökan|besvär) hos (?P<court>\w+) '
-                   '(om förhandsbesked|yrkade)',
-             'method': 'match',
-             'type': ('instans',),
-             'court': ('REG', 'HFD')},
-            {'name': 'myndighetsbeslut',
-             're': '(?P<court>\w+) beslutade (därefter |)(den (?P<date>\d+ \w+ \d+)|'
-                   '[\w ]+) att',
-             'method': 'match',
-             'type': ('instans',),
-             'court': ('REG', 'HFD', 'MIG')},
-            {'name': 'myndighetsbeslut2',
-             're': '(?P<court>[\w ]+) (bedömde|vägrade) i (bistånds|)beslut'
-                   ' (|den (?P<date>\d+ \w+ \d+))',
-             'method': 'match',
-             'type': ('instans',),
-             'court': ('REG', 'HFD')},
-            {'name': 'hd-revision',
-             're': '(?P<karanden>[\w\.\(\)\- ]+) sökte revision och yrkade(,'
-                   'i första hand,|, såsom hans talan fick förstås,|,|) att (?P<court>HD|)',
-             'method': 'match',
-             'type': ('instans',),
-             'court': ('HDO',)},
-            {'name': 'hd-revision2',
-             're': '(?P<karanden>[\w\.\(\)\- ]+) sökte revision$',
-             'method': 'match',
-             'type': ('instans',),
-             'court': 'HDO'},
-            {'name': 'hd-revision3',
-             're': '(?P<karanden>[\w\.\(\)\- ]+) sökte revision och framställde samma yrkanden',
-             'method': 'match',
-             'type': ('instans',),
-             'court': 'HDO'},
-            {'name': 'överklag-bifall',
-             're': '(?P<karanden>[\w\.\(\)\- ]+) (anförde besvär|'
-                   'överklagade) och yrkade bifall till (sin talan i '
-                   '(?P<prevcourt>HovR:n|TR:n)|)',
-             'method': 'match',
-             'type': ('instans',),
-             'court': ('HDO', 'HGO', 'HNN', 'HON', 'HSB', 'HSV', 'HVS')},
-            {'name': 'överklag-2',
-             're': '(?P<karanden>[\w\.\(\)\- ]+) överklagade '
-                   '(för egen del |)och yrkade (i själva saken |)att '
-                   '(?P<court>HD|HovR:n|kammarrätten|Regeringsrätten|)',
-             'method': 'match',
-             'type': ('instans',)},
-            {'name': 'överklag-3',
-             're': '(?P<karanden>[\w\.\(\)\- ]+) överklagade (?P<prevcourt>'
-                   '\w+)s (beslut|omprövningsbeslut|dom)( i ersättningsfrågan|) (hos|till) '
-                   '(?P<court>[\w\, ]+?)( och yrkade| och anförde|, som| \(Sverige\)|$)',
-             'method': 'match',
-             'type': ('instans',)},
-            {'name': 'överklag-4',
-             're': '(?!Även )(?P<karanden>(?!HD fastställer)[\w\.\(\)\- ]+) överklagade ((?P<prevcourt>\w+)s (beslut|dom)|beslutet|domen)( och|$)',
-             'method': 'match',
-             'type': ('instans',)},
-            {'name': 'hd-ansokan',
-             're': '(?P<karanden>[\w\.\(\)\- ]+) anhöll i ansökan som inkom '
-                   'till (?P<court>HD) d \d+ \w+ \d+',
-             'method': 'match',
-             'type': ('instans',),
-             'court': ('HDO',)},
-            {'name': 'hd-skrivelse',
-             're': '(?P<karanden>[\w\.\(\)\- ]+) anförde i en till '
-                   '(?P<court>HD) den \d+ \w+ \d+ ställd',
-             'method': 'match',
-             'type': ('instans',),
-             'court': ('HDO',)},
-            {'name': 'överklag-5',
-             're': '(?!Även )(?P<karanden>[\w\.\(\)\- ]+?) överklagade '
-                   '(?P<prevcourt>\w+)s (dom|domar)',
-             'method': 'match',
-             'type': ('instans',)},
-            {'name': 'överklag-6',
-             're': '(?P<karanden>[\w\.\(\)\- ]+) överklagade domen till '
-                   '(?P<court>\w+)($| och yrkade)',
-             'method': 'match',
-             'type': ('instans',)},
-            {'name': 'myndighetsbeslut3',
-             're': 'I sitt beslut den (?P<date>\d+ \w+ \d+) avslog '
-                   '(?P<court>\w+)',
-             'method': 'match',
-             'type': ('instans',),
-             'court': ('REG', 'HFD', 'MIG')},
-            {'name': 'domskal',
-             're': "(Skäl|Domskäl|HovR:ns domskäl|Hovrättens domskäl)(\. |$)",
-             'method': 'match',
-             'type': ('domskal',)},
-            {'name': 'domskal-ref',
-             're': "(Tingsrätten|TR[:\.]n|Hovrätten|HD|Högsta förvaltningsdomstolen) \([^)]*\) (meddelade|anförde|fastställde|yttrade)",
-             'method': 'match',
-             'type': ('domskal',)},
-            {'name': 'domskal-dom-fr',  # a simplified copy of fr-överkl
-             're': '(?P<court>(Förvaltningsrätten|'
-                   'Länsrätten|Kammarrätten) i \w+(| län)'
-                   '(|, migrationsdomstolen|, Migrationsöverdomstolen)|'
-                   'Högsta förvaltningsdomstolen) \((?P<date>\d+-\d+-\d+), '
-                   '(?P<constitution>[\w\.\- ,]+)\),? yttrade',
-             'method': 'match',
-             'type': ('domskal',)},
-            {'name': 'domslut-standalone',
-             're': '(Domslut|(?P<court>Hovrätten|HD|hd|Högsta förvaltningsdomstolen):?s avgörande)$',
-             'method': 'match',
-             'type': ('domslut',)},
-            {'name': 'domslut-start',
-             're': '(?P<court>[\w ]+(domstolen|rätten))s avgörande$',
-             'method': 'match',
-             'type': ('domslut',)}
-        )
         court = basefile.split("/")[0]
-        matchers = defaultdict(list)
-        matchersname = defaultdict(list)
-        for pat in rx:
-            if 'court' not in pat or court in pat['court']:
-                for t in pat['type']:
-                    # print("Adding pattern %s to %s" %  (pat['name'], t))
-                    matchers[t].append(
-                        getattr(
-                            re.compile(
-                                pat['re'],
-                                re.UNICODE),
-                            pat['method']))
-                    matchersname[t].append(pat['name'])
+        if court not in self.court_matchers:
+            matchers = defaultdict(list)
+            for match, pat in self.parser_matchers:
+                if 'court' not in pat or court in pat['court']:
+                    for t in pat['type']:
+                        # print("Adding pattern %s to %s" %  (pat['name'], t))
+                        matchers[t].append((match, pat))
+            self.court_matchers[court] = dict((t, self.make_matchers(matchers[t]))
+                                              for t in matchers)
+        matchers = self.court_matchers[court]
+        # the analyze_* functions below loop over these for every
+        # chunk, so look them up once
+        instans_matchers = matchers.get('instans', ())
+        dom_matchers = matchers.get('dom', ())
+        domskal_matchers = matchers.get('domskal', ())
+        domslut_matchers = matchers.get('domslut', ())
+        domskal_match = self.domskal_match
+        parse_swedish_date = self.parse_swedish_date
+        parse_iso_date = self.parse_iso_date
 
         def is_delmal(parser, chunk=None):
             # should handle "IV", "I (UM1001-08)" and "I." etc
@@ -1833,9 +2396,11 @@ class DV(SwedishLegalSource):
             if chunk:
                 strchunk = str(chunk)
             else:
-                strchunk = str(parser.reader.peek()).strip()
-            if len(strchunk) < 20:
-                m = re.match("(I{1,3}|IV)\.? ?(|\(\w+\-\d+\))$", strchunk)
+                strchunk = parser.reader.peekstr().strip()
+            # (all delmål markers are short and start with "I", check
+            # that before trying the regex)
+            if len(strchunk) < 20 and strchunk[:1] == "I":
+                m = self.re_delmal.match(strchunk)
                 if m:
                     res = {'id': m.group(1)}
                     if m.group(2):
@@ -1848,8 +2413,7 @@ class DV(SwedishLegalSource):
             of the report.
 
             """
-            chunk = parser.reader.peek()
-            strchunk = str(chunk)
+            strchunk = parser.reader.peekstr()
             res = analyze_instans(strchunk)
             # sometimes, HD domskäl is written in a way that mirrors
             # the referat of the lower instance (eg. "1. Optimum
@@ -1890,8 +2454,8 @@ class DV(SwedishLegalSource):
             # True
             # if newcourt is True:
             #     return newcourt
-            newcourt = canonicalize_court(newcourt)
-            oldcourt = canonicalize_court(oldcourt)
+            newcourt = self.canonicalize_court(newcourt)
+            oldcourt = self.canonicalize_court(oldcourt)
             if newcourt is True and str(oldcourt) in ('Högsta domstolen'):
                 # typically an effect of both parties appealing to the
                 # supreme court
@@ -1901,57 +2465,54 @@ class DV(SwedishLegalSource):
             else:
                 return False
 
-        def canonicalize_court(courtname):
-            if isinstance(courtname, bool):
-                return courtname  # we have no idea which court this
-                # is, only that it is A court
-            else:
-                return courtname.replace(
-                    "HD", "Högsta domstolen").replace("HovR", "Hovrätt")
-
         def is_heading(parser):
-            chunk = parser.reader.peek()
-            strchunk = str(chunk)
-            if not strchunk.strip():
-                return False
+            strchunk = parser.reader.peekstr()
             # a heading is reasonably short and does not end with a
-            # period (or other sentence ending typography)
-            return len(strchunk) < 140 and not (strchunk.endswith(".") or
-                                                strchunk.endswith(":") or
-                                                strchunk.startswith("”"))
+            # period (or other sentence ending typography). Most
+            # chunks are long paragraphs, so check length first.
+            if len(strchunk) >= 140 or not strchunk.strip():
+                return False
+            return not strchunk.endswith((".", ":")) and not strchunk.startswith("”")
 
         def is_betankande(parser):
-            strchunk = str(parser.reader.peek())
+            strchunk = parser.reader.peekstr()
             return strchunk in ("Målet avgjordes efter föredragning.",
                                 "HD avgjorde målet efter föredragning.")
         
         def is_dom(parser):
-            strchunk = str(parser.reader.peek())
+            strchunk = parser.reader.peekstr()
             res = analyze_dom(strchunk)
             return res
 
         def is_domskal(parser):
-            strchunk = str(parser.reader.peek())
+            strchunk = parser.reader.peekstr()
             res = analyze_domskal(strchunk)
             return res
 
         def is_domslut(parser):
-            strchunk = str(parser.reader.peek())
+            strchunk = parser.reader.peekstr()
             return analyze_domslut(strchunk)
 
+        # is_skiljaktig, is_tillagg and is_endmeta are tried one
+        # after another on the same chunk, so match all three once
+        # and remember which one (if any) it was
+        section = [None, None]
+
+        def section_kind(parser):
+            strchunk = parser.reader.peekstr()
+            if strchunk is not section[0]:
+                m = self.re_section.match(strchunk)
+                section[:] = strchunk, m.lastgroup if m else None
+            return section[1]
+
         def is_skiljaktig(parser):
-            strchunk = str(parser.reader.peek())
-            return re.match(
-                "(Justitie|Kammarrätts)råde[nt] ([^\.]*) var (skiljaktig|av skiljaktig mening)", strchunk)
+            return section_kind(parser) == "skiljaktig"
 
         def is_tillagg(parser):
-            strchunk = str(parser.reader.peek())
-            return re.match(
-                "Justitieråde[nt] ([^\.]*) (tillade för egen del|gjorde för egen del ett tillägg)", strchunk)
+            return section_kind(parser) == "tillagg"
 
         def is_endmeta(parser):
-            strchunk = str(parser.reader.peek())
-            return re.match("HD:s (beslut|dom|domar) meddela(de|d|t): den", strchunk)
+            return section_kind(parser) == "endmeta"
 
         def is_paragraph(parser):
             return True
@@ -1965,15 +2526,26 @@ class DV(SwedishLegalSource):
         # Erliksson, referent, och C. Bohlin", so another heuristic is
         # that the sentence before can't end in a single capital
         # letter.
+        #
+        # All four analyze_* functions split the same chunk, so cache
+        # the result (callers only ever slice it).
+        @lru_cache(maxsize=16)
         def split_sentences(text):
             text = util.normalize_space(text)
             text += " "
-            return [x.strip() for x in re.split("(?<![A-ZÅÄÖ])\. (?=[A-ZÅÄÖ]|$)", text)]
-
+            return [x.strip() for x in self.re_sentence_end.split(text)]
+
+        # The analyze_* functions are called with the same chunk
+        # several times: by their recognizer, again by it whenever a
+        # state is popped and the chunk re-examined, and finally by
+        # make_instans/make_dom. Since they're pure, remember the
+        # results for the most recent chunks (callers must not
+        # modify the returned dicts).
+        @lru_cache(maxsize=16)
         def analyze_instans(strchunk):
             res = {}
             # Case 1: Fixed headings indicating new instance
-            if re_courtname.match(strchunk):
+            if self.re_courtname.match(strchunk):
                 res['court'] = strchunk
                 res['complete'] = True
                 return res
@@ -1994,15 +2566,14 @@ class DV(SwedishLegalSource):
                 # start of an Instans. Since recognizers come in a
                 # particular order, is_instans is run before
                 # is_domskal, we must detect this false positive
-                domskal_match = matchers['domskal'][matchersname['domskal'].index('domskal')]
                 if domskal_match(sentences[0]):
                     return res
                 for sentence in sentences:
-                    for (r, rname) in zip(matchers['instans'], matchersname['instans']):
+                    for r in instans_matchers:
                         m = r(sentence)
                         if m:
+                            rname, mg = m
                             # print("analyze_instans: Matcher '%s' succeeded on '%s'" % (rname, sentence))
-                            mg = m.groupdict()
                             if 'court' in mg and mg['court']:
                                 res['court'] = mg['court'].strip()
                             else:
@@ -2010,15 +2581,14 @@ class DV(SwedishLegalSource):
                             # if 'prevcourt' in mg and mg['prevcourt']:
                             #    res['prevcourt'] = mg['prevcourt'].strip()
                             if 'date' in mg and mg['date']:
-                                parse_swed = DV().parse_swedish_date
-                                parse_iso = DV().parse_iso_date
                                 try:
-                                    res['date'] = parse_swed(mg['date'])
+                                    res['date'] = parse_swedish_date(mg['date'])
                                 except ValueError:
-                                    res['date'] = parse_iso(mg['date'])
+                                    res['date'] = parse_iso_date(mg['date'])
                             return res
             return res
 
+        @lru_cache(maxsize=16)
         def analyze_dom(strchunk):
             res = {}
             # special case for "referat" who are nothing but straight verdict documents.
@@ -2026,21 +2596,19 @@ class DV(SwedishLegalSource):
                 return {'court': True}
             # probably only the 1st sentence is interesting
             for sentence in split_sentences(strchunk)[:1]:
-                for (r, rname) in zip(matchers['dom'], matchersname['dom']):
+                for r in dom_matchers:
                     m = r(sentence)
                     if m:
-                        # print("analyze_dom: Matcher '%s' succeeded on '%s': %r" % (rname, sentence,m.groupdict()))
-                        mg = m.groupdict()
+                        rname, mg = m
+                        # print("analyze_dom: Matcher '%s' succeeded on '%s': %r" % (rname, sentence, mg))
                         if 'court' in mg and mg['court']:
                             res['court'] = mg['court'].strip()
                         if 'date' in mg and mg['date']:
-                            parse_swed = DV().parse_swedish_date
-                            parse_iso = DV().parse_iso_date
                             try:
-                                res['date'] = parse_swed(mg['date'])
+                                res['date'] = parse_swedish_date(mg['date'])
                             except ValueError:
                                 try:
-                                    res['date'] = parse_iso(mg['date'])
+                                    res['date'] = parse_iso_date(mg['date'])
                                 except ValueError:
                                     pass
                                     # or res['date'] = mg['date']??
@@ -2050,11 +2618,12 @@ class DV(SwedishLegalSource):
                         return res
             return res
 
+        @lru_cache(maxsize=16)
         def analyze_domskal(strchunk):
             res = {}
             # only 1st sentence
             for sentence in split_sentences(strchunk)[:1]:
-                for (r, rname) in zip(matchers['domskal'], matchersname['domskal']):
+                for r in domskal_matchers:
                     m = r(sentence)
                     if m:
                         # print("analyze_domskal: Matcher '%s' succeeded on '%s'" % (rname, sentence))
@@ -2062,15 +2631,16 @@ class DV(SwedishLegalSource):
                         return res
             return res
 
+        @lru_cache(maxsize=16)
         def analyze_domslut(strchunk):
             res = {}
             # only 1st sentence
             for sentence in split_sentences(strchunk)[:1]:
-                for (r, rname) in zip(matchers['domslut'], matchersname['domslut']):
+                for r in domslut_matchers:
                     m = r(sentence)
                     if m:
+                        rname, mg = m
                         # print("analyze_domslut: Matcher '%s' succeeded on '%s'" % (rname, sentence))
-                        mg = m.groupdict()
                         if 'court' in mg and mg['court']:
                             res['court'] = mg['court'].strip()
                         else:
@@ -2083,11 +2653,10 @@ class DV(SwedishLegalSource):
             for thing in strchunk.split(", "):
                 if thing in ("ordförande", "referent"):
                     res[-1]['position'] = thing
-                elif thing.startswith("ordförande ") or thing.startswith("ordf "):
+                elif thing.startswith(("ordförande ", "ordf ")):
                     pos, name = thing.split(" ", 1)
-                    if name.startswith("t f lagmannen"):
-                        title, name = name[:13], name[14:]
-                    elif name.startswith("hovrättsrådet"):
+                    # both titles are 13 chars
+                    if name.startswith(("t f lagmannen", "hovrättsrådet")):
                         title, name = name[:13], name[14:]
                     else:
                         title = None
@@ -2119,8 +2688,9 @@ class DV(SwedishLegalSource):
 
         @newstate('instans')
         def make_instans(parser):
+            # the recognizers have already converted this chunk
+            strchunk = parser.reader.peekstr()
             chunk = parser.reader.next()
-            strchunk = str(chunk)
             idata = analyze_instans(strchunk)
             # idata may be {} if the special toplevel rule in is_instans applied
             if 'complete' in idata:
@@ -2163,7 +2733,7 @@ class DV(SwedishLegalSource):
         def make_dom(parser):
             # fix date, constitution etc. Note peek() instead of read() --
             # this is so is_domskal can have a chance at the same data
-            ddata = analyze_dom(str(parser.reader.peek()))
+            ddata = analyze_dom(parser.reader.peekstr())
             d = Dom(avgorandedatum=ddata.get('date'),
                     court=ddata.get('court'),
                     malnr=ddata.get('caseid'))
@@ -2198,19 +2768,20 @@ class DV(SwedishLegalSource):
             return parser.make_children(m)
 
         def make_paragraph(parser):
+            strchunk = parser.reader.peekstr()
             chunk = parser.reader.next()
-            strchunk = str(chunk)
             if not strchunk.strip():  # filter out empty things
                 return None
-            if parser.has_ordered_paras and ordered(strchunk):
+            ordinal = parser.has_ordered_paras and ordered(strchunk)
+            if ordinal:
                 # FIXME: Cut the ordinal from chunk somehow
                 if isinstance(chunk, Paragraph):
                     chunks = list(chunk)
-                    chunks[0] = re.sub("^\s*\d+\. ", "", chunks[0])
-                    p = OrderedParagraph(chunks, ordinal=ordered(strchunk))
+                    chunks[0] = self.re_ordinal_prefix.sub("", chunks[0])
+                    p = OrderedParagraph(chunks, ordinal=ordinal)
                 else:
-                    chunk = re.sub("^\s*\d+\. ", "", chunk)
-                    p = OrderedParagraph([chunk], ordinal=ordered(strchunk))
+                    chunk = self.re_ordinal_prefix.sub("", chunk)
+                    p = OrderedParagraph([chunk], ordinal=ordinal)
             else:
                 if isinstance(chunk, Paragraph):
                     p = chunk
@@ -2227,7 +2798,12 @@ class DV(SwedishLegalSource):
             # EU law, sometimes "18 Blahonga". Treat these the same.
             # NOTE: It should not match eg "24hPoker är en
             # bolagskonstruktion..." (HDO/B2760-09)
-            m = re.match("(\d+)\.?\s", chunk)
+            #
+            # Most paragraphs don't start with a digit at all, which
+            # is much cheaper to check than running the regex.
+            if not chunk[:1].isdigit():
+                return None
+            m = self.re_ordinal.match(chunk)
             if m:
                 return m.group(1)
 
@@ -2460,10 +3036,8 @@ class DV(SwedishLegalSource):
         "HovR:n över Skåne och Blekinge": "HSB",
         "Hovrätten för Nedre Norrland": "HNN",
         "Hovrätten för Västra Sverige": "HVS",
-        "Hovrätten för Västra Sverige": "HVS",
         "Hovrätten för Övre Norrland": "HON",
         "Hovrätten över Skåne och Blekinge": "HSB",
-        "Hovrätten över Skåne och Blekinge": "HSB",
         "Svea HovR": "HSV",
         "Svea hovrätt": "HSV",
 
@@ -2705,6 +3279,32 @@ class DV(SwedishLegalSource):
         "Östersunds TR": "TÖS"
     }
 
+    @cached_property
+    def _courtslugs_normalized(self):
+        # courtslugs keyed on lowercased, whitespace-normalized
+        # names. Names that normalize to the same key but have
+        # different slugs (eg "Migrationsdomstolen"/"migrationsdomstolen")
+        # are left out, since we can't tell which one is meant.
+        res = {}
+        ambiguous = set()
+        for court, slug in self.courtslugs.items():
+            key = util.normalize_space(court).lower()
+            if res.setdefault(key, slug) != slug:
+                ambiguous.add(key)
+        for key in ambiguous:
+            del res[key]
+        return res
+
+    def courtslug(self, court):
+        """Returns the slug for the court named *court*, or None if
+        there isn't one. Names that only differ from a known name in
+        case or whitespace are recognized as well."""
+        slug = self.courtslugs.get(court)
+        if slug is None:
+            slug = self._courtslugs_normalized.get(
+                util.normalize_space(court).lower())
+        return slug
+
     def construct_id(self, node, state):
         if isinstance(node, Delmal):
             state = dict(state)
@@ -2712,9 +3312,10 @@ class DV(SwedishLegalSource):
         elif isinstance(node, Instans):
             if node.court:
                 state = dict(state)
-                courtslug = self.courtslugs.get(node.court, "XXX")
-                if courtslug == "XXX":
+                courtslug = self.courtslug(node.court)
+                if courtslug is None:
                     self.log.warning("%s No slug defined for court %s" % (state["basefile"], node.court))
+                    courtslug = "XXX"
                 if "#" not in state['uri']:
                     state['uri'] += "#"
                 else:
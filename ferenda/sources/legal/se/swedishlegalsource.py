@@ -1471,6 +1471,12 @@ class SwedishLegalSource(DocumentRepository):
         # the right place?
         return datetime.strptime(datestr, "%Y-%m-%d").date()
 
+    # used by parse_swedish_date
+    re_iso_date = re.compile(r'(\d{4})-(\d{2})-(\d{2})')
+    re_numeric_date = re.compile(r'(\d+)[^\d]{1,3}(\d+)[^\d]{1,3}(\d+)')
+    re_letter_digit = re.compile(r"([a-z])(\d)")
+    re_digit_letter = re.compile(r"(\d)([a-z])")
+
     def parse_swedish_date(self, datestr):
         """Parses a number of common forms of expressing swedish dates with
         varying precision.
@@ -1492,6 +1498,7 @@ class SwedishLegalSource(DocumentRepository):
         if not datestr:
             raise ValueError("empty date string")
         day = month = year = None
+        m = self.re_iso_date.match(datestr)
         # assume strings on the form "3 februari 2010"
         # strings on the form "vid utg\xe5ngen av december 1999"
         if datestr.startswith("vid utg\xe5ngen av"):
@@ -1500,11 +1507,10 @@ class SwedishLegalSource(DocumentRepository):
             month = self.swedish_months[month]
             year = int(year)
             day = calendar.monthrange(year, month)[1]
-        elif re.match(r'\d{4}-\d{2}-\d{2}', datestr): # well-formed, but might have a trailing hyphen 
-            m = re.match(r'(\d{4})-(\d{2})-(\d{2})', datestr)
+        elif m: # well-formed, but might have a trailing hyphen 
             year, month, day = [int(x) for x in m.groups()]
-        elif re.match(r'(\d+)[^\d]{1,3}(\d+)[^\d]{1,3}(\d+)', datestr):
-            m = re.match(r'(\d+)[^\d]{1,3}(\d+)[^\d]{1,3}(\d+)', datestr) # typical anomalies in the wild
+        elif self.re_numeric_date.match(datestr):
+            m = self.re_numeric_date.match(datestr) # typical anomalies in the wild
             if len(m.group(1)) < 4:
                 if int(m.group(1)) >= 80:  # '80-01-01' => '1980-01-01',
                     year = 1900 + int(m.group(1))
@@ -1518,8 +1524,8 @@ class SwedishLegalSource(DocumentRepository):
             # assume strings on the form "3 februari 2010", "8 dec. 1997"
             # first normalize misformtting like "7juni 2007"
             datestr = datestr.lower()
-            datestr = re.sub(r"([a-z])(\d)", "\\1 \\2", datestr)
-            datestr = re.sub(r"(\d)([a-z])", "\\1 \\2", datestr)
+            datestr = self.re_letter_digit.sub("\\1 \\2", datestr)
+            datestr = self.re_digit_letter.sub("\\1 \\2", datestr)
             components = datestr.split()
             try:
                 year = int(components[-1])
@@ -1635,27 +1641,28 @@ class SwedishCitationParser(CitationParser):
     # needles = ['§', 'prop.', 'SOU', 'Ds', 'NJA', 'HFD', 'lagen', 'Lagen', 'örordningen', 'balken', 'Act', 'avsnitt', 'bet.']
     # if not any(needle in string for needle in self.needles):
     def parse_string(self, string, predicate="dcterms:references"):
-        # basic normalization without stripping (NOTE: this messes up
-        # Preformatted sections, so parse_recursive avoids calling
-        # this for those). FIXME: We should remove this normalization,
-        # it's not parse_string's place to do this. Unfortunately
-        # other parts rely on this normalization for the time being
-        # (parts of the test suite fails without). We should fix that.
-        string = string.replace("\r\n", " ").replace("\n", " ").replace("\x00","")
+        return self._parse_string(string, predicate)
 
-        self.seen_strings += 1
+    def parse_strings(self, strings, predicate="dcterms:references"):
+        """Like :py:meth:`parse_string`, but for a list of strings from
+        the same context (eg. all Lagrum references in the metadata
+        of a document). Returns a list of results, one for each
+        string.
 
-        # first, do a quick check to see if we even need to parse
-        if self.filter and not self.filter.search(string):
-            return [string]
-        self.parsed_strings += 1
+        """
+        # the base uri attributes are the same for all strings, so
+        # only compute them once
+        attributes = self._baseuri_attributes()
+        return [self._parse_string(string, predicate, attributes) for string in strings]
 
+    re_urisegments = re.compile(r'([\w]+://[^/]+/[^\d]*)(\d+:(bih\.[_ ]|N|)?\d+([_ ]s\.\d+|))#?(K([a-z0-9]+)|)(P([a-z0-9]+)|)(S(\d+)|)(N(\d+)|)')
+
+    def _baseuri_attributes(self):
         # transform self._currenturl => attributes.
         # FIXME: we should maintain a self._current_baseuri_attributes
         # instead of this fragile, URI-interpreting, hack.
         if self._currenturl:
-            re_urisegments = re.compile(r'([\w]+://[^/]+/[^\d]*)(\d+:(bih\.[_ ]|N|)?\d+([_ ]s\.\d+|))#?(K([a-z0-9]+)|)(P([a-z0-9]+)|)(S(\d+)|)(N(\d+)|)')
-            m = re_urisegments.match(self._currenturl)
+            m = self.re_urisegments.match(self._currenturl)
             if m:
                 attributes = {'law':m.group(2),
                               'chapter':m.group(6),
@@ -1671,6 +1678,28 @@ class SwedishCitationParser(CitationParser):
         for k in list(attributes):
             if attributes[k] is None:
                 del attributes[k]
+        return attributes
+
+    def _parse_string(self, string, predicate, attributes=None):
+        # basic normalization without stripping (NOTE: this messes up
+        # Preformatted sections, so parse_recursive avoids calling
+        # this for those). FIXME: We should remove this normalization,
+        # it's not parse_string's place to do this. Unfortunately
+        # other parts rely on this normalization for the time being
+        # (parts of the test suite fails without). We should fix that.
+        string = string.replace("\r\n", " ").replace("\n", " ").replace("\x00","")
+
+        self.seen_strings += 1
+
+        # first, do a quick check to see if we even need to parse
+        if self.filter and not self.filter.search(string):
+            return [string]
+        self.parsed_strings += 1
+
+        if attributes is None:
+            attributes = self._baseuri_attributes()
+        else:
+            attributes = dict(attributes)
         try:
             res = self._legalrefparser.parse(string,
                                               minter=self._minter,
@@ -34,7 +34,10 @@ class WordReader(object):
         """Converts the word file to a more easily parsed format.
 
         :param wordfile: Path to original docfile
-        :param intermediatefp: An open filehandle to write the more parseable file to
+        :param intermediatefp: An open filehandle to write the more parseable
+                               file to (or a file-like object without a
+                               ``mode``, like :py:class:`io.BytesIO`, which
+                               is written to)
         :returns: filetype (either "doc" or "docx")
         :rtype: str
 
@@ -46,7 +49,7 @@ class WordReader(object):
         # the text from the binary blob (either through running
         # antiword for old-style doc documents, or by unzipping
         # document.xml, for new-style docx documents)
-        if "r" in intermediatefp.mode:
+        if "r" in getattr(intermediatefp, "mode", "wb"):
             # sniff the intermediate to see if its a
             # docbook or a OOXML file
             start = intermediatefp.read(1024)
@@ -76,18 +76,20 @@ class DV(OrigDV, SameAs):
         # (also, this version handles the uncommon but valid case
         # where one referat concerns multiple dom:s)
         domuri = resource.value(RPUBL.referatAvDomstolsavgorande).identifier 
+        publisher = self.lookup_resource(head["Domstol"])
+        gtmp = Graph()
+        gtmp.bind("rpubl", RPUBL)
+        gtmp.bind("dcterms", DCTERMS)
         for malnummer in head['_localid']:
             bnodetmp = BNode()
-            gtmp = Graph()
-            gtmp.bind("rpubl", RPUBL)
-            gtmp.bind("dcterms", DCTERMS)
             dtmp = Describer(gtmp, bnodetmp)
             dtmp.rdftype(RPUBL.VagledandeDomstolsavgorande)
             dtmp.value(RPUBL.malnummer, malnummer)
             dtmp.value(RPUBL.avgorandedatum, head['Avgörandedatum'])
-            dtmp.rel(DCTERMS.publisher, self.lookup_resource(head["Domstol"]))
-            rtmp = dtmp.graph.resource(bnodetmp)
+            dtmp.rel(DCTERMS.publisher, publisher)
+            rtmp = gtmp.resource(bnodetmp)
             domuri_sameas = coin_uri(rtmp)
+            gtmp.remove((bnodetmp, None, None))
             resource.graph.add((URIRef(domuri), OWL.sameAs, URIRef(domuri_sameas)))
         return resource
     
@@ -6,13 +6,26 @@ from builtins import *
 from ferenda.testutil import RepoTester, parametrize_repotester
 from ferenda.testutil import Py23DocChecker
 import doctest
+import os
+import re
+import shutil
+import tempfile
 import unittest
+import zipfile
+from bz2 import BZ2File
+from io import BytesIO
+from ftplib import error_perm
 from datetime import date
 
+from layeredconfig import LayeredConfig, Defaults
+from rdflib import Graph, Literal, URIRef, RDF, RDFS
+from rdflib.namespace import DCTERMS
+
 # SUT
-from ferenda.sources.legal.se import DV
+from ferenda.sources.legal.se import DV, RPUBL
 from ferenda.sources.legal.se.dv import KeywordContainsDescription 
-from ferenda import fsmparser
+from ferenda import fsmparser, util, errors, Describer, DocumentRepository
+from ferenda.compat import patch
 
 class TestDVParserBase(unittest.TestCase):
     maxDiff = None
@@ -594,6 +607,41 @@ class TestDomslut(TestDVParserBase):
                "Migrationsöverdomstolens avgörande. Migrationsöverdomstolen "
                "bifaller")
 
+class TestHeading(TestDVParserBase):
+    method = "is_heading"
+
+    def test_basic(self):
+        self.t(True, "Bakgrund")
+        self.t(False, "Målet avgjordes efter föredragning.")
+        self.t(False, "Yrkanden m.m.:")
+        self.t(False, "   ")
+        self.t(False, "Utan punkt på slutet " * 10)
+
+
+class TestSkiljaktig(TestDVParserBase):
+    method = "is_skiljaktig"
+
+    def test_basic(self):
+        self.t(True, "Justitierådet Lindskog var skiljaktig och anförde:")
+        self.t(True, "Kammarrättsrådet Sjögren var av skiljaktig mening.")
+        self.t(False, "Justitierådet Lindskog tillade för egen del:")
+
+
+class TestTillagg(TestDVParserBase):
+    method = "is_tillagg"
+
+    def test_basic(self):
+        self.t(True, "Justitierådet Lindskog tillade för egen del:")
+        self.t(False, "Justitierådet Lindskog var skiljaktig och anförde:")
+
+
+class TestEndmeta(TestDVParserBase):
+    method = "is_endmeta"
+
+    def test_basic(self):
+        self.t(True, "HD:s dom meddelad: den 5 maj 2004.")
+        self.t(False, "HD fastställer hovrättens domslut.")
+
 class TestKeywords(unittest.TestCase):
 
     def test_keyword_sets(self):
@@ -654,3 +702,581 @@ avslag)"""
                              cm.exception.descriptions)
 
 
+class TestMapfile(unittest.TestCase):
+
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.mapfile = self.datadir + "/dv/generated/uri.map"
+        self.config = LayeredConfig(Defaults({'datadir': self.datadir,
+                                              'url': 'http://localhost:8000/',
+                                              'force': False,
+                                              'fulltextindex': False,
+                                              'mapfiletype': 'apache',
+                                              'storetype': 'a',
+                                              'storelocation': 'b',
+                                              'storerepository': 'c'}))
+        self.writeparsed("HDO/T1-14", "http://localhost:8000/rf/nja/2014s1")
+        self.writeparsed("HDO/T2-14", "http://localhost:8000/rf/nja/2014s1")  # dupe
+        self.writeparsed("HDO/T3-14", None)  # no head[@about]
+        util.writefile(self.datadir + "/dv/parsed/HDO/T4-14.xhtml", "")
+        self.writeparsed("HFD/1000-13", "http://localhost:8000/rf/hfd/2014:1")
+
+    def tearDown(self):
+        shutil.rmtree(self.datadir)
+
+    def writeparsed(self, basefile, uri):
+        if uri:
+            head = '<head about="%s">' % uri
+        else:
+            head = '<head>'
+        util.writefile(self.datadir + "/dv/parsed/%s.xhtml" % basefile,
+                       '<html xmlns="http://www.w3.org/1999/xhtml">%s</head></html>' % head)
+
+    @patch('ferenda.documentrepository.TripleStore')
+    def test_relate_all_setup(self, mock_store):
+        DV.relate_all_setup(self.config)
+        # the duplicate check is made before the "/rf/" prefix is
+        # stripped, so for apache mapfiles duplicate paths are kept
+        self.assertEqual("nja/2014s1\tHDO/T1-14\n"
+                         "nja/2014s1\tHDO/T2-14\n"
+                         "hfd/2014:1\tHFD/1000-13\n",
+                         util.readfile(self.mapfile))
+
+        # an up-to-date mapfile isn't regenerated...
+        os.utime(self.mapfile, (os.stat(self.mapfile).st_atime,
+                                os.stat(self.mapfile).st_mtime + 10))
+        util.writefile(self.mapfile, "nja/2014s1\tHDO/T1-14\n")
+        os.utime(self.mapfile, (os.stat(self.mapfile).st_atime,
+                                os.stat(self.mapfile).st_mtime + 10))
+        DV.relate_all_setup(self.config)
+        self.assertEqual("nja/2014s1\tHDO/T1-14\n",
+                         util.readfile(self.mapfile))
+
+        # ...unless forced
+        self.config.force = True
+        DV.relate_all_setup(self.config)
+        self.assertEqual("nja/2014s1\tHDO/T1-14\n"
+                         "nja/2014s1\tHDO/T2-14\n"
+                         "hfd/2014:1\tHFD/1000-13\n",
+                         util.readfile(self.mapfile))
+
+    def test_basefile_from_uri(self):
+        util.writefile(self.mapfile, "nja/2014s1\tHDO/Ö1-14\n"
+                       "\n"
+                       "hfd/2014:1\tHFD/1000-13\n")
+        repo = DV(datadir=self.datadir)
+        base = "http://rinfo.lagrummet.se/publ/rf/"
+        self.assertEqual("HDO/Ö1-14", repo.basefile_from_uri(base + "nja/2014s1"))
+        self.assertEqual("HFD/1000-13", repo.basefile_from_uri(base + "hfd/2014:1"))
+        # cases not in the map get URI-derived basefiles
+        self.assertEqual("nja/1975s1", repo.basefile_from_uri(base + "nja/1975s1"))
+        self.assertEqual("hfd/2014/2", repo.basefile_from_uri(base + "hfd/2014:2"))
+
+        util.writefile(self.mapfile, "/rf/nja/2014s1\t/dv/generated/HDO/Ö1-14.html;\n")
+        repo = DV(datadir=self.datadir, mapfiletype="nginx")
+        self.assertEqual("HDO/Ö1-14", repo.basefile_from_uri(base + "nja/2014s1"))
+
+    def test_open_mapfile(self):
+        repo = DV(datadir=self.datadir)
+        util.writefile(self.mapfile, "")
+        fp = repo._open_mapfile(self.mapfile)
+        fp.write("nja/2014s1\tHDO/T1-14\n")
+        self.assertIs(fp, repo._open_mapfile(self.mapfile))
+        # a mapfile replaced behind our back (like relate_all_setup
+        # does) is reopened
+        util.writefile(self.mapfile + ".new", "hfd/2014:1\tHFD/1000-13\n")
+        util.robust_rename(self.mapfile + ".new", self.mapfile)
+        newfp = repo._open_mapfile(self.mapfile)
+        self.assertIsNot(fp, newfp)
+        newfp.write("nja/2014s2\tHDO/T2-14\n")
+        # the file is closed at the end of the parse batch
+        DV.parse_all_teardown(self.config)
+        self.assertTrue(newfp.closed)
+        self.assertEqual("hfd/2014:1\tHFD/1000-13\n"
+                         "nja/2014s2\tHDO/T2-14\n",
+                         util.readfile(self.mapfile))
+
+    @patch('ferenda.documentrepository.TripleStore')
+    def test_relate_all_setup_nginx(self, mock_store):
+        self.config.mapfiletype = "nginx"
+        DV.relate_all_setup(self.config)
+        self.assertEqual("/rf/nja/2014s1\t/dv/generated/HDO/T1-14.html;\n"
+                         "/rf/hfd/2014:1\t/dv/generated/HFD/1000-13.html;\n",
+                         util.readfile(self.mapfile))
+
+
+class TestExtractNotis(unittest.TestCase):
+
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.repo = DV(datadir=self.datadir)
+
+    def tearDown(self):
+        shutil.rmtree(self.datadir)
+
+    def test_docx(self):
+        source = "test/files/repo/dv/source/"
+        with zipfile.ZipFile(source + "referat-notis.zip") as zipf:
+            zipf.extract("HFD_2012_notis_017-044.docx", self.datadir)
+        self.assertEqual((1, 0), self.repo.extract_notis(
+            self.datadir + "/HFD_2012_notis_017-044.docx", "2012", "HFD"))
+        self.assertTrue(os.path.exists(
+            self.repo.store.downloaded_path("HFD/2012_not_17")))
+        with BZ2File(source + "HFD_2012_not_17.xml.bz2") as fp:
+            want = fp.read()
+        with self.repo.store.open_intermediate("HFD/2012_not_17", "rb") as fp:
+            got = fp.read()
+        self.assertEqual(want, got)
+
+
+class TestDocname(unittest.TestCase):
+
+    def t(self, want, name):
+        m = DV.re_docname.match(name)
+        self.assertEqual(want, (m.lastgroup,) + m.groups()[m.lastindex:m.lastindex + 5])
+
+    def test_kinds(self):
+        self.t(("plain", "HDO", "T3467-96", "", "1", ".doc"),
+               "HDO_T3467-96_1.doc")
+        self.t(("bytut", "HDO", "T3467-96", "", "1", ".doc"),
+               "HDO_T3467-96_BYTUT_2010-03-17_1.doc")
+        self.t(("bytut", "HDO", "T254-89", "1", "", ".doc"),
+               "HDO_T254-89_1_BYTUT_2009-04-28.doc")
+        self.t(("tabort", "ADO", "2013-63", "", "", ".docx"),
+               "ADO_2013-63_TABORT_2014-01-02.docx")
+        self.assertIsNone(DV.re_docname.match("HDO_B_BYTUT_x.doc"))
+
+
+class TestDownloadedToIntermediate(unittest.TestCase):
+
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.repo = DV(datadir=self.datadir)
+        dst = self.repo.store.downloaded_path("ADO/2013-63")
+        util.ensure_dir(dst)
+        shutil.copy("test/files/repo/dv/downloaded/ADO/2013-63.docx", dst)
+
+    def tearDown(self):
+        shutil.rmtree(self.datadir)
+
+    def test_docx(self):
+        fp = self.repo.downloaded_to_intermediate("ADO/2013-63")
+        got = fp.read()
+        self.assertEqual("docx", self.repo.filetype)
+        self.assertIn(b"Arbetsdomstolen", got)
+        # the returned data should be identical to what's been stored
+        with self.repo.store.open_intermediate("ADO/2013-63", "rb") as fp:
+            self.assertEqual(got, fp.read())
+
+
+class TestInferIdentifier(unittest.TestCase):
+
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.repo = DV(datadir=self.datadir)
+        uri = URIRef("https://lagen.nu/dom/nja/2004s510")
+        g = self.repo.make_graph()
+        g.add((uri, RDF.type, RPUBL.Rattsfallsreferat))
+        g.add((uri, DCTERMS.identifier, Literal("NJA 2004 s. 510", lang="sv")))
+        g.add((uri, RPUBL.referatAvDomstolsavgorande, URIRef(str(uri) + "#dom")))
+        g.add((URIRef(str(uri) + "#dom"), DCTERMS.identifier,
+               Literal("HD T 3811-03")))
+        with self.repo.store.open_distilled("HDO/B3811-03", "wb") as fp:
+            g.serialize(fp, format="pretty-xml")
+
+    def tearDown(self):
+        shutil.rmtree(self.datadir)
+
+    def test_infer(self):
+        self.assertEqual("NJA 2004 s. 510",
+                         self.repo.infer_identifier("HDO/B3811-03"))
+
+    def test_missing(self):
+        with self.assertRaises(ValueError):
+            self.repo.infer_identifier("HDO/T1-17")
+
+    def test_canonical_uri(self):
+        # only trust the identifier of the node about the canonical
+        # uri, even if another referat node comes first in the file
+        uri = URIRef("https://lagen.nu/dom/nja/2004s511")
+        g = self.repo.make_graph()
+        g.add((uri, RDF.type, RPUBL.Rattsfallsreferat))
+        g.add((uri, DCTERMS.identifier, Literal("NJA 2004 s. 511", lang="sv")))
+        with self.repo.store.open_distilled("HDO/B3811-03", "rb") as fp:
+            g.parse(data=fp.read())
+        with self.repo.store.open_distilled("HDO/B3811-03", "wb") as fp:
+            g.serialize(fp, format="pretty-xml")
+        for canonical, identifier in (("https://lagen.nu/dom/nja/2004s510", "NJA 2004 s. 510"),
+                                      ("https://lagen.nu/dom/nja/2004s511", "NJA 2004 s. 511")):
+            with patch.object(self.repo, 'canonical_uri', return_value=canonical):
+                self.assertEqual(identifier, self.repo.infer_identifier("HDO/B3811-03"))
+
+
+class TestSanitizeMetadata(unittest.TestCase):
+
+    def test_courtname_lookup_cached(self):
+        repo = DV()
+        with patch('ferenda.DocumentRepository._lookup_resource', autospec=True,
+                   side_effect=DocumentRepository._lookup_resource) as _lookup_resource:
+            for i in range(2):
+                head = repo.sanitize_metadata({'Domstol': 'Högsta Domstolen',
+                                               'Referat': 'NJA 2007 s. 227 (NJA 2007:32)',
+                                               'Målnummer': 'B 86-05',
+                                               'Avgörandedatum': '2007-04-04'},
+                                              "HDO/B86-05")
+                self.assertEqual('Högsta domstolen', head['Domstol'])
+        # one failed exact and one fuzzy lookup, both for the first
+        # call only
+        self.assertEqual(2, _lookup_resource.call_count)
+
+    def test_missing_referat(self):
+        repo = DV()
+        repo.filetype = "docx"
+        with BZ2File("test/files/repo/dv/intermediate/ADO/2013-63.xml.bz2") as fp:
+            head = repo.extract_head(fp, "ADO/2013-63")
+        del head['Referat']
+        head = repo.sanitize_metadata(head, "ADO/2013-63")
+        self.assertEqual("AD 2013 nr 63", head['Referat'])
+        # the Referat is reconstructed from the basefile given, not
+        # from whatever document extract_head last saw
+        head = repo.sanitize_metadata({'Domstol': 'Marknadsdomstolen',
+                                       'Målnummer': 'B 1/16',
+                                       'Avgörandedatum': '2016-05-04'},
+                                      "MDO/2016-5")
+        self.assertEqual("MD 2016:5", head['Referat'])
+
+    def test_lookup_resource_cached(self):
+        repo = DV()
+        with patch('ferenda.DocumentRepository._lookup_resource', autospec=True,
+                   side_effect=DocumentRepository._lookup_resource) as _lookup_resource:
+            with patch.object(repo.log, 'warning') as warning:
+                uri = repo.lookup_resource("Högsta domstolen")
+                for i in range(2):
+                    self.assertEqual(uri, repo.lookup_resource("Högsta domstolen"))
+                    self.assertEqual(uri, repo.lookup_resource("Högsta domstolenn", warn=False))
+                    # the warning for a fuzzy match is logged every time
+                    self.assertEqual(uri, repo.lookup_resource("Högsta domstolenn"))
+                    self.assertEqual(i + 1, warning.call_count)
+            self.assertEqual(2, _lookup_resource.call_count)
+
+
+class TestAddKeyword(unittest.TestCase):
+
+    def test_subkeywords(self):
+        repo = DV()
+        desc = Describer(Graph(), "http://example.org/dom")
+        repo.add_keyword_to_metadata(desc, ("Allmän handling", "Begärd handling saknades"))
+        node = desc.graph.value(URIRef("http://example.org/dom"), DCTERMS.subject)
+        self.assertEqual(Literal("Allmän handling»Begärd handling saknades", lang="sv"),
+                         desc.graph.value(node, RDFS.label))
+        # the describer still describes the document afterwards
+        desc.value(DCTERMS.title, "Titel")
+        self.assertEqual(Literal("Titel"),
+                         desc.graph.value(URIRef("http://example.org/dom"), DCTERMS.title))
+
+
+class TestFindLabels(unittest.TestCase):
+
+    def test_find_labels(self):
+        repo = DV()
+        root = repo.parse_xml("""<row>
+  <entry>Målnummer:</entry><entry>B86-05</entry>
+  <entry><emphasis>Rubrik</emphasis>: Not a label: really</entry>
+  <entry>Lagrum:</entry><entry>Lagrum: 2 kap. 8 §</entry>
+  <entry>REFERAT</entry>
+</row>""")
+        found = repo.find_labels(root, repo.header_labels, 'EFERAT')
+        self.assertEqual(["EFERAT", "Lagrum", "Målnummer"], sorted(found))
+        self.assertEqual("Lagrum:", found["Lagrum"].text)
+        self.assertEqual("Målnummer:", found["Målnummer"].text)
+        self.assertEqual("REFERAT", found["EFERAT"].text)
+
+    def test_substring(self):
+        repo = DV()
+        root = repo.parse_xml("""<row>
+  <entry>Litteratur: se nedan</entry>
+  <entry>HD:s Målnummer:</entry><entry>B86-05</entry>
+  <entry>Sökord: Rättsfall:</entry>
+  <entry> Litteratur: </entry><entry>Boken</entry>
+</row>""")
+        found = repo.find_labels(root, repo.header_labels)
+        self.assertEqual(["Litteratur", "Målnummer", "Rättsfall", "Sökord"], sorted(found))
+        # labels may occur anywhere in a text node...
+        self.assertEqual("HD:s Målnummer:", found["Målnummer"].text)
+        self.assertIs(found["Sökord"], found["Rättsfall"])
+        # ...except Litteratur, which must be on its own
+        self.assertEqual(" Litteratur: ", found["Litteratur"].text)
+
+
+class TestCourtslug(unittest.TestCase):
+
+    def test_courtslug(self):
+        repo = DV()
+        self.assertEqual("HVS", repo.courtslug("Hovrätten för Västra Sverige"))
+        self.assertEqual("HVS", repo.courtslug("hovrätten för  Västra sverige"))
+        self.assertEqual("MID", repo.courtslug("Migrationsdomstolen"))
+        self.assertEqual("MD", repo.courtslug("migrationsdomstolen"))
+        # ambiguous when case is ignored
+        self.assertIsNone(repo.courtslug("MIGRATIONSDOMSTOLEN"))
+        self.assertIsNone(repo.courtslug("Okänd domstol"))
+
+
+class TestMakeMatchers(unittest.TestCase):
+
+    def test_fused(self):
+        repo = DV()
+        pats = [{'name': 'a', 're': '(?P<court>HD) sa', 'method': 'match'},
+                {'name': 'b', 're': '(?P<court>\\w+) (?P<verb>sa)', 'method': 'match'},
+                {'name': 'c', 're': 'sa (?P<what>\\w+)', 'method': 'search'},
+                {'name': 'd', 're': 'nej', 'method': 'match'}]
+        matchers = repo.make_matchers([(getattr(re.compile(pat['re']), pat['method']), pat)
+                                       for pat in pats])
+        # all four are combined, and still tried in order
+        self.assertEqual(1, len(matchers))
+        matcher = matchers[0]
+        self.assertEqual(('a', {'court': 'HD'}), matcher("HD sa nej"))
+        self.assertEqual(('b', {'court': 'TR', 'verb': 'sa'}), matcher("TR sa nej"))
+        # c is a search pattern, which wins over d even though d
+        # matches at the start of the string
+        self.assertEqual(('c', {'what': 'ja'}), matcher("nej, sa ja"))
+        self.assertEqual(('d', {}), matcher("nej"))
+        self.assertEqual(None, matcher("ja"))
+
+
+class TestParseOOXML(unittest.TestCase):
+
+    def test_body(self):
+        repo = DV()
+        tc = "<w:tc><w:p><w:r><w:t>%s</w:t></w:r></w:p></w:tc>"
+        doc = """<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body><w:tbl>
+  <w:tr>%s%s</w:tr>
+  <w:tr>%s%s</w:tr>
+  <w:tr>%s</w:tr>
+  <w:tr><w:tc>
+    <w:p><w:r><w:t>First paragraph.</w:t></w:r></w:p>
+    <w:p><w:r><w:t>Second </w:t></w:r><w:r><w:txbxContent><w:p><w:r><w:t>boxed</w:t></w:r></w:p></w:txbxContent></w:r></w:p>
+  </w:tc></w:tr>
+  <w:tr>%s%s</w:tr>
+</w:tbl></w:body></w:document>""" % (tc % "Högsta domstolen", tc % "NJA 2007 s. 227",
+                                      tc % "Målnummer:", tc % "B86-05",
+                                      tc % "REFERAT",
+                                      tc % "Sökord:", tc % "Skadestånd")
+        head, body = repo.parse_ooxml(doc, "HDO/B86-05")
+        self.assertEqual("Högsta domstolen", head['Domstol'])
+        self.assertEqual("NJA 2007 s. 227", head['Referat'])
+        self.assertEqual("B86-05", head['Målnummer'])
+        self.assertEqual("Skadestånd", head['Sökord'])
+        # nested paragraphs come right after their containing paragraph
+        self.assertEqual(["First paragraph.", "Second boxed", "boxed"], body)
+
+    def test_labels_in_body(self):
+        repo = DV()
+        tc = "<w:tc><w:p><w:r><w:t>%s</w:t></w:r></w:p></w:tc>"
+        p = "<w:p><w:r><w:t>%s</w:t></w:r></w:p>"
+        doc = """<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body><w:tbl>
+  <w:tr>%s%s</w:tr>
+  <w:tr>%s</w:tr>
+  <w:tr><w:tc>%s%s%s%s%s%s</w:tc></w:tr>
+</w:tbl></w:body></w:document>""" % (tc % "Högsta domstolen", tc % "NJA 2007 s. 227",
+                                      tc % "REFERAT",
+                                      p % "First paragraph.",
+                                      p % "Litteratur: se nedan",
+                                      p % "Avgörandedatum:", p % "2007-04-05",
+                                      p % "Sökord:", p % "Skadestånd")
+        head, body = repo.parse_ooxml(doc, "HDO/B86-05")
+        # labels that only occur in the body are still found
+        self.assertEqual("2007-04-05", head['Avgörandedatum'])
+        self.assertEqual("Skadestånd", head['Sökord'])
+        self.assertNotIn('Litteratur', head)
+        self.assertEqual(["First paragraph.", "Litteratur: se nedan",
+                          "Avgörandedatum:", "2007-04-05", "Sökord:", "Skadestånd"], body)
+
+
+class TestParseDocbook(unittest.TestCase):
+
+    def test_labels(self):
+        repo = DV()
+        doc = """<article><para>Högsta domstolen | NJA 2007 s. 227<informaltable>
+<tgroup><tbody><row>
+  <entry>HD:s Målnummer:</entry><entry>B86-05</entry>
+</row><row>
+  <entry>REFERAT</entry>
+</row></tbody></tgroup>
+<tgroup><tbody><row><entry>Body text.</entry></row></tbody></tgroup>
+<tgroup><tbody><row>
+  <entry>Sökord:</entry><entry>Skadestånd</entry>
+</row><row>
+  <entry>Litteratur: se nedan</entry><entry>Fel</entry>
+</row></tbody></tgroup>
+</informaltable></para></article>"""
+        head, body = repo.parse_antiword_docbook(doc, "HDO/B86-05")
+        self.assertEqual("Högsta domstolen", head['Domstol'])
+        self.assertEqual("B86-05", head['Målnummer'])
+        self.assertEqual("Skadestånd", head['Sökord'])
+        self.assertNotIn('Litteratur', head)
+        self.assertEqual(["Body text."], body)
+
+
+class TestProcessZipfiles(unittest.TestCase):
+
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        for subdir, zipname in (("NJA", "NJA_referat_2007.zip"),
+                                ("ADO", "referat_2013-08-23.zip"),
+                                ("", "referat_2013-08-23.zip")):
+            dst = os.path.join(self.datadir, "dv", "downloaded", "zips", subdir, zipname)
+            util.ensure_dir(dst)
+            shutil.copy("test/files/repo/dv/source/" + zipname, dst)
+
+    def tearDown(self):
+        shutil.rmtree(self.datadir)
+
+    def test_process_all_zipfiles(self):
+        # zips in subdirs are processed before the toplevel ones, and
+        # a later zip may replace or remove documents from an earlier
+        # one, so the outcome depends on the global ordering
+        repo = DV(datadir=self.datadir)
+        repo.process_all_zipfiles()
+        self.assertEqual(7, repo.downloadcount)
+        self.assertEqual(["ADO/2013-63.docx", "HDO/B86-05.doc", "HDO/Ö4503-04.doc",
+                          "MIG/UM7533-12.docx"],
+                         sorted(os.path.relpath(f, repo.store.datadir + "/downloaded").replace(os.sep, "/")
+                                for f in util.list_dirs(repo.store.datadir + "/downloaded")
+                                if "zips" not in f))
+
+
+class FakeResponse(object):
+    def __init__(self, content):
+        self.content = content
+        self.raw = BytesIO(content)
+        self.closed = False
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSession(object):
+    # a minimal stand-in for requests.Session, serving directory
+    # listings like lagen.nu/dv/downloaded/ and zips
+    base = "https://lagen.nu/dv/downloaded/"
+    pages = {"": '<html><body><a href="/">Up</a> <a href="ADO/">ADO/</a> '
+                 '<a href="referat_1.zip">referat_1.zip</a> '
+                 '<a href="referat_2.zip">referat_2.zip</a></body></html>',
+             "ADO/": '<html><body><a href="ADO_1.zip">ADO_1.zip</a> '
+                     '<a href="ADO_2.zip">ADO_2.zip</a></body></html>'}
+
+    def __init__(self):
+        self.responses = []
+
+    def get(self, url, stream=False):
+        path = url[len(self.base):]
+        if path in self.pages:
+            resp = FakeResponse(self.pages[path].encode())
+        else:
+            resp = FakeResponse(("ZIP " + path).encode())
+        self.responses.append(resp)
+        return resp
+
+
+class TestDownloadWWW(unittest.TestCase):
+
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.repo = DV(datadir=self.datadir, downloadthreads=2)
+        self.repo.session = FakeSession()
+        self.zipdir = self.repo.store.datadir + "/downloaded/zips/"
+
+    def tearDown(self):
+        shutil.rmtree(self.datadir)
+
+    def test_download(self):
+        processed = []
+        def process(path):
+            processed.append((path, util.readfile(path, "rb")))
+        session = self.repo.session
+        def get(url, stream=False):
+            if url.endswith("/"):
+                # the listing of the parent directory is closed
+                # before any subdirectory is visited
+                self.assertTrue(all(r.closed for r in session.responses))
+            return FakeSession.get(session, url, stream)
+        with patch.object(self.repo, 'process_zipfile', side_effect=process):
+            with patch.object(session, 'get', side_effect=get):
+                self.repo.download_www("", True)
+        self.assertTrue(all(r.closed for r in session.responses))
+        # zips are processed one at a time, in listing order
+        self.assertEqual([(self.zipdir + "ADO/ADO_1.zip", b"ZIP ADO/ADO_1.zip"),
+                          (self.zipdir + "ADO/ADO_2.zip", b"ZIP ADO/ADO_2.zip"),
+                          (self.zipdir + "referat_1.zip", b"ZIP referat_1.zip"),
+                          (self.zipdir + "referat_2.zip", b"ZIP referat_2.zip")],
+                         processed)
+
+    def test_stop_early(self):
+        with patch.object(self.repo, 'process_zipfile',
+                          side_effect=errors.MaxDownloadsReached):
+            with self.assertRaises(errors.MaxDownloadsReached):
+                self.repo.download_www("ADO/", True)
+        # zips fetched but never processed are not left behind
+        self.assertEqual([self.zipdir + "ADO/ADO_1.zip"],
+                         list(util.list_dirs(self.zipdir)))
+
+
+class FakeFTP(object):
+    # a minimal stand-in for ftplib.FTP, serving a fixed tree
+    tree = {"": [("ADO", "dir"), ("referat_1.zip", "file"), ("HDO", "dir"),
+                 ("referat_2.zip", "file")],
+            "ADO": [("ADO_1.zip", "file")],
+            "HDO": [("HDO_1.zip", "file"), ("old", "dir")],
+            "HDO/old": [("HDO_0.zip", "file")]}
+
+    def __init__(self, mlsd=True):
+        self.cwds = []
+        self.has_mlsd = mlsd
+
+    def cwd(self, dirname):
+        self.cwds.append(dirname)
+
+    def mlsd(self, facts=[]):
+        if not self.has_mlsd:
+            raise error_perm("500 Unknown command.")
+        return [(name, {"type": kind}) for name, kind in self.tree[self.cwds[-1].strip("/")]]
+
+    def retrlines(self, cmd, callback):
+        for name, kind in self.tree[self.cwds[-1].strip("/")]:
+            callback("%s--------- 1 ftp ftp 0 Jan 01 00:00 %s" % ("d" if kind == "dir" else "-", name))
+
+    def retrbinary(self, cmd, callback):
+        callback(cmd.encode())
+
+
+class TestDownloadFTP(unittest.TestCase):
+
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.repo = DV(datadir=self.datadir)
+
+    def tearDown(self):
+        shutil.rmtree(self.datadir)
+
+    def _test(self, connection):
+        with patch.object(self.repo, 'process_zipfile') as mock_process:
+            self.repo.download_ftp("", True, connection=connection)
+        zipdir = self.repo.store.datadir + "/downloaded/zips/"
+        self.assertEqual([zipdir + "ADO/ADO_1.zip",
+                          zipdir + "referat_1.zip",
+                          zipdir + "HDO/HDO_1.zip",
+                          zipdir + "HDO/old/HDO_0.zip",
+                          zipdir + "referat_2.zip"],
+                         [c[0][0] for c in mock_process.call_args_list])
+        self.assertEqual(b"RETR HDO_0.zip", util.readfile(zipdir + "HDO/old/HDO_0.zip", "rb"))
+        self.assertEqual(["/", "/ADO", "/", "/HDO", "/HDO/old", "/", "/"], connection.cwds)
+
+    def test_mlsd(self):
+        self._test(FakeFTP())
+
+    def test_list(self):
+        self._test(FakeFTP(mlsd=False))
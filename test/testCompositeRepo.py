@@ -119,10 +119,34 @@ class TestComposite(RepoTester):
         self.assertEqual("basefile 3, repo a",
                          util.readfile(self.datadir+"/a/downloaded/3.html"))
 
+    def test_download_concurrent(self):
+        self.repo.config.concurrent_subrepo_download = True
+        try:
+            self.repo.download()
+        finally:
+            self.repo.config.concurrent_subrepo_download = False
+        self.assertEqual("basefile 1, repo a",
+                         util.readfile(self.datadir+"/a/downloaded/1.html"))
+        self.assertEqual("basefile 2, repo b",
+                         util.readfile(self.datadir+"/b/downloaded/2/index.html"))
+
+    def test_lazy_instances(self):
+        # no subrepo instances should be created until they're needed
+        repo = CompositeExample(datadir=self.datadir)
+        self.assertEqual([], list(repo._instances))
+        repo.download()
+        self.assertEqual([SubrepoBSubclass, SubrepoASubclass],
+                         list(repo._instances))
+
     def test_list_basefiles_for(self):
         self.repo.download()
         self.assertEqual(set(["3", "2", "1"]),
                          set(self.repo.store.list_basefiles_for("parse")))
+        self.assertEqual((SubrepoBSubclass, SubrepoASubclass),
+                         self.repo.store.classes_for("1"))
+        self.assertEqual((SubrepoASubclass,),
+                         self.repo.store.classes_for("3"))
+        self.assertEqual((), self.repo.store.classes_for("4"))
 
     def test_parse(self):
         self.repo.download()
@@ -156,6 +180,29 @@ class TestComposite(RepoTester):
         self.assertEqual(set(["1", "3"]),
                          set(self.repo.store.list_basefiles_for("generate")))
 
+    def test_parse_nested_attachment(self):
+        # attachments in subdirectories can't be created through
+        # parsed_path, but a subrepo may still write them
+        self.repo.download()
+        substore = self.repo.get_instance(SubrepoBSubclass).store
+        subdir = os.path.dirname(substore.parsed_path("1"))
+        util.writefile(subdir + "/images/x.png", "nested attachment")
+        self.assertTrue(self.repo.parse("1"))
+        self.assertEqual(["attach.txt", os.sep.join(["images", "x.png"])],
+                         sorted(self.repo.store.list_attachments("1", "parsed")))
+        dstdir = os.path.dirname(self.repo.store.parsed_path("1"))
+        self.assertEqual("nested attachment",
+                         util.readfile(dstdir + "/images/x.png"))
+
+    def test_remove(self):
+        self.repo.download()
+        self.assertTrue(self.repo.parse("1"))
+        self.assertTrue(self.repo.store.remove("1"))
+        self.assertFalse(os.path.exists(self.repo.store.parsed_path("1")))
+        self.assertFalse(os.path.exists(self.datadir+"/a/downloaded/1.html"))
+        self.assertFalse(os.path.exists(self.datadir+"/b/downloaded/1/index.html"))
+        self.assertTrue(os.path.exists(self.datadir+"/b/downloaded/2/index.html"))
+
     def test_config(self):
         # test it with self.repo being initialized with some kwargs parameters
         self.repo.download()
@@ -168,6 +215,28 @@ class TestComposite(RepoTester):
 #        got = self.repo.custom()
 #        self.assertEqual("Hello world!", got)
 
+    def test_config_keeps_store(self):
+        # setting a config with the same datadir should keep the
+        # store (and any basefiles it has already discovered)
+        store = self.repo.store
+        self.repo.config = self.repo.config
+        self.assertIs(store, self.repo.store)
+
+    def test_config_new_datadir(self):
+        # basefiles found under the old datadir must not carry over
+        # to a store for a different datadir
+        self.repo.download()
+        self.assertTrue(list(self.repo.store.list_basefiles_for("parse")))
+        store = self.repo.store
+        oldconfig = self.repo.config
+        self.addCleanup(setattr, self.repo, "config", oldconfig)
+        config = LayeredConfig(Defaults({'datadir': self.datadir + os.sep + "other"}),
+                               cascade=True)
+        self.repo.config = config
+        self.assertIsNot(store, self.repo.store)
+        self.assertEqual({}, dict(self.repo.store.basefiles))
+        self.assertIsNone(self.repo.store._basefile_classes)
+
 class PersistConfig(RepoTester):
     repoclass = CompositeExample
 
@@ -226,6 +295,14 @@ class TestExtrabase(RepoTester):
         got = self.repo.qualified_class_name()
         self.assertEqual("Q:testCompositeRepo.SubrepoBSubclass", got)
 
+    def test_shared_classes(self):
+        # the classes with extrabases mixed in should only be created
+        # once, and shared between instances
+        other = CompositeExtrabase(datadir=self.datadir)
+        self.assertEqual(self.repo.subrepos, other.subrepos)
+        self.assertTrue(issubclass(other.subrepos[0], Mixin))
+        self.assertTrue(issubclass(other.subrepos[0], SubrepoBSubclass))
+
 
 class RenamingRepo(DocumentRepository):
     alias = "renaming"
@@ -278,3 +355,12 @@ class BasefileRename(RepoTester):
         
         # make sure a reparse works
         self.assertTrue(self.repo.parse("a/1"))
+
+    def test_rename_foreign_instance(self):
+        # instances yielded by an overridden get_preferred_instances
+        # need not have been created by get_instance
+        inst = self.repo.get_instance(RenamingRepo)
+        del inst._qcn
+        self.repo.store.basefiles[RenamingRepo].add("a/1")
+        self.repo.parse("a/1")
+        self.assertTrue(os.path.exists(inst.store.parsed_path("b/1")))
@@ -50,6 +50,14 @@ class TestPeekable(unittest.TestCase):
         self.assertEqual(pk.next(),2)
         self.assertEqual(pk.next(),3)
 
+    def test_peekstr(self):
+        pk = Peekable(range(3))
+        self.assertEqual(pk.peekstr(), "0")
+        self.assertEqual(pk.peekstr(), "0")
+        self.assertEqual(pk.next(), 0)
+        self.assertEqual(pk.peekstr(), "1")
+        self.assertEqual(pk.peek(2), 2)
+        self.assertEqual(pk.peekstr(), "1")
         
 
 
@@ -353,6 +361,36 @@ class Parse(unittest.TestCase):
         with self.assertRaises(FSMStateError):
             self.run_test_file("test/files/fsmparser/no-transition.tx")
 
+    def test_remove_recognizer(self):
+        def is_a(parser):
+            return parser.reader.peek() == "a"
+
+        def is_any(parser):
+            return True
+
+        def make_a(parser):
+            parser.reader.next()
+            return "A"
+
+        def make_any(parser):
+            return parser.reader.next()
+
+        @newstate('body')
+        def make_body(parser):
+            return parser.make_children([])
+
+        p = FSMParser()
+        p.set_recognizers(is_a, is_any)
+        p.set_transitions({("body", is_a): (make_a, None),
+                           ("body", is_any): (make_any, None)})
+        p.initial_state = "body"
+        p.initial_constructor = make_body
+        self.assertEqual(["A", "b"], p.parse(["a", "b"]))
+        # the recognizers applicable in each state must be
+        # recalculated after this
+        p.remove_recognizer(is_a)
+        self.assertEqual(["a", "b"], p.parse(["a", "b"]))
+
     def test_debug(self):
         with patch("builtins.print") as printmock:
             self.run_test_file("test/files/fsmparser/basic.txt", debug=True)